@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+"""Benchmark the adapter prediction stages on simulated small RNA
+   libraries. Libraries are generated deterministically from the
+   options, so results of different commits can be compared. Each
+   stage runs in its own process to record its peak memory, and
+   results are written in JSON.
+
+"""
+
+import sys
+import os.path
+import json
+import time
+import signal
+import platform
+import resource
+import subprocess
+import multiprocessing
+from argparse import ArgumentParser
+
+cur = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(cur))
+import dnapilib
+from dnapilib import kmer
+from dnapilib.io_utils import get_file_obj, fastq_sequence
+from dnapilib.kmer import KmerCounter, filter_kmers, assemble_kmers
+from dnapilib.kmer import _calc_overlap
+from dnapilib.apred import adapter_prediction, iterative_adapter_prediction
+from dnapilib.apred import adaptive_adapter_prediction
+from dnapilib.exhaust import clip_adapter, clip_adapters
+from dnapilib.simulate import ADAPTER, simulate_reads, write_fastq
+
+
+KMER_LENS = [9, 11]
+RATIOS = [1.2, 1.3, 1.4]
+SAMPLE_NUM = 50000
+SEED_LEN = 7
+STAGES = ("read", "count_kmers", "filter_kmers", "assemble_kmers",
+          "calc_overlap", "clip_adapter", "clip_adapters",
+          "single", "iterative", "adaptive")
+FORMATS = {"plain": (None, ".fq"), "gz": ("gz", ".fq.gz"),
+           "bgzf": ("bgzf", ".bgzf.fq.gz"), "bz2": ("bz2", ".fq.bz2"),
+           "xz": ("xz", ".fq.xz"), "zst": ("zst", ".fq.zst")}
+
+
+def make_library(args, scale, fmt):
+    """Return a simulated FASTQ, which is written once per
+       set of parameters in the work directory.
+
+    """
+    params = [scale, args.seed, args.read_len, args.insert_mean,
+              args.insert_sd, args.error_rate, args.polya_rate,
+              args.low_comp_rate, args.adapter[:12]]
+    name = "sim_" + "_".join(map(str, params))
+    compression, ext = FORMATS[fmt]
+    fastq = os.path.join(args.work_dir, name + ext)
+    if not os.path.exists(fastq):
+        reads = simulate_reads(scale, args.adapter, args.read_len,
+                               args.insert_mean, args.insert_sd,
+                               error_rate=args.error_rate,
+                               polya_rate=args.polya_rate,
+                               low_comp_rate=args.low_comp_rate,
+                               seed=args.seed)
+        write_fastq(fastq + ".tmp", reads, compression)
+        os.rename(fastq + ".tmp", fastq)
+    return fastq
+
+
+def _frequencies(fastq):
+    fq_obj = get_file_obj(fastq, binary=True)
+    counter = KmerCounter(KMER_LENS)
+    counter.update(fastq_sequence(fq_obj), SAMPLE_NUM)
+    fq_obj.close()
+    return dict((k, counter.frequency(k)) for k in KMER_LENS)
+
+
+def _filtered(fastq):
+    freqs = _frequencies(fastq)
+    return [(k, filter_kmers(freqs[k], k, r))
+            for k in KMER_LENS for r in RATIOS]
+
+
+def _is_correct(adapter, adapts):
+    if not adapts:
+        return False
+    pred = adapts[0][0][:12]
+    return adapter.startswith(pred) or pred.startswith(adapter)
+
+
+def run_stage(stage, fastq, args):
+    """Return (setup, timed function) of a stage. The setup runs
+       before timing, and the function returns (number of reads
+       processed or None, extra results).
+
+    """
+    if stage == "read":
+        def func(data):
+            fq_obj = get_file_obj(fastq, binary=True)
+            n = sum(1 for _ in fastq_sequence(fq_obj))
+            fq_obj.close()
+            return n, {}
+        return (lambda: None), func
+    if stage == "count_kmers":
+        def func(data):
+            fq_obj = get_file_obj(fastq, binary=True)
+            counter = KmerCounter(KMER_LENS)
+            n = counter.update(fastq_sequence(fq_obj))
+            fq_obj.close()
+            return n, {"distinct_kmers": dict(
+                (k, len(counter.frequency(k))) for k in KMER_LENS)}
+        return (lambda: None), func
+    if stage == "filter_kmers":
+        def func(freqs):
+            for k in KMER_LENS:
+                for r in RATIOS:
+                    filter_kmers(freqs[k], k, r)
+            return None, {}
+        return (lambda: _frequencies(fastq)), func
+    if stage == "assemble_kmers":
+        def func(cleans):
+            for k, clean in cleans:
+                assemble_kmers(clean, k//2)
+            return None, {"kmers": sum([len(c) for k, c in cleans])}
+        return (lambda: _filtered(fastq)), func
+    if stage == "calc_overlap":
+        def func(cleans):
+            n = 0
+            for k, clean in cleans:
+                seqs = [s for s, c in clean[:100]]
+                for x in seqs:
+                    for y in seqs:
+                        _calc_overlap(x, y, k//2)
+                        n += 1
+            return None, {"pairs": n}
+        return (lambda: _filtered(fastq)), func
+    if stage in ("clip_adapter", "clip_adapters"):
+        def func(data):
+            fq_obj = get_file_obj(fastq, binary=True)
+            seed = args.adapter[:SEED_LEN]
+            if stage == "clip_adapter":
+                n = sum(1 for _ in clip_adapter(fq_obj, seed, 0, 0, 16, 36))
+            else:
+                fas = clip_adapters(fq_obj, [seed], 0, 0, 16, 36)[seed]
+                n = fas.read_count
+            fq_obj.close()
+            return None, {"clipped": n}
+        return (lambda: None), func
+    if stage == "single":
+        def func(data):
+            adapts = adapter_prediction(fastq, RATIOS[-1], KMER_LENS[0],
+                                        SAMPLE_NUM)
+            return None, {"correct": _is_correct(args.adapter, adapts)}
+        return (lambda: None), func
+    if stage == "iterative":
+        def func(data):
+            adapts = iterative_adapter_prediction(fastq, RATIOS, KMER_LENS,
+                                                  SAMPLE_NUM)
+            return None, {"correct": _is_correct(args.adapter, adapts)}
+        return (lambda: None), func
+    if stage == "adaptive":
+        def func(data):
+            predictor = adaptive_adapter_prediction(fastq, RATIOS, KMER_LENS)
+            return predictor.read_count, {
+                "correct": _is_correct(args.adapter, predictor.predict()),
+                "converged": predictor.converged}
+        return (lambda: None), func
+    raise Exception("bad stage: {}".format(stage))
+
+
+def _child(stage, fastq, args, conn):
+    try:
+        setup, func = run_stage(stage, fastq, args)
+        data = setup()
+        wall, cpu = time.perf_counter(), time.process_time()
+        reads, extra = func(data)
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        conn.send({"wall": round(wall, 4), "cpu": round(cpu, 4),
+                   "reads": reads, "peak_rss_mb": round(peak, 1),
+                   "extra": extra})
+    except Exception as e:
+        conn.send({"error": str(e)})
+    conn.close()
+
+
+def time_stage(stage, fastq, args):
+    """Run a stage in a new process, and return its timing.
+
+    """
+    ctx = multiprocessing.get_context("fork")
+    recv, send = ctx.Pipe(False)
+    proc = ctx.Process(target=_child, args=(stage, fastq, args, send))
+    proc.start()
+    send.close()
+    try:
+        result = recv.recv()
+    except EOFError:
+        result = {"error": "stage process died"}
+    proc.join()
+    return result
+
+
+def metadata():
+    """Return information on the run environment.
+
+    """
+    meta = {"dnapi": dnapilib.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": kmer.np.__version__ if kmer.np is not None else None,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    try:
+        meta["commit"] = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=cur,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        meta["commit"] = None
+    return meta
+
+
+def compare(results, base_file):
+    """Print wall time ratios of results to a previous run.
+
+    """
+    base = json.load(open(base_file))
+    key = lambda x: (x["stage"], x["scale"], x["format"])
+    old = dict((key(x), x) for x in base["results"] if "wall" in x)
+    print("# stage\tscale\tformat\tbase_wall\twall\tratio")
+    for x in results:
+        if key(x) in old and "wall" in x:
+            b = old[key(x)]["wall"]
+            ratio = x["wall"] / b if b else float("nan")
+            print("{}\t{}\t{}\t{:.4f}\t{:.4f}\t{:.2f}".format(
+                x["stage"], x["scale"], x["format"], b, x["wall"], ratio))
+
+
+def benchmark(args):
+    scales = [int(x) for x in args.scales.split(",")]
+    formats = args.formats.split(",")
+    stages = args.stages.split(",")
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise Exception("bad format: {}".format(fmt))
+    for stage in stages:
+        if stage not in STAGES:
+            raise Exception("bad stage: {}".format(stage))
+    if min(scales) <= 0:
+        raise Exception("bad value: --scales")
+    if not os.path.exists(args.work_dir):
+        os.makedirs(args.work_dir)
+
+    results = []
+    print("# stage\tscale\tformat\twall\tcpu\treads/s\tpeak_rss_mb")
+    for scale in scales:
+        for fmt in formats:
+            fastq = make_library(args, scale, fmt)
+            size = os.path.getsize(fastq)
+            for stage in stages:
+                for rep in range(args.repeat):
+                    x = time_stage(stage, fastq, args)
+                    x.update({"stage": stage, "scale": scale, "format": fmt,
+                              "file_bytes": size, "repeat": rep})
+                    results.append(x)
+                    if "error" in x:
+                        print("{}\t{}\t{}\terror: {}".format(
+                            stage, scale, fmt, x["error"]))
+                        continue
+                    rate = "NA"
+                    if x["reads"] and x["wall"]:
+                        rate = "{:.0f}".format(x["reads"] / x["wall"])
+                    print("{}\t{}\t{}\t{:.4f}\t{:.4f}\t{}\t{}".format(
+                        stage, scale, fmt, x["wall"], x["cpu"], rate,
+                        x["peak_rss_mb"]))
+                    sys.stdout.flush()
+
+    out = {"meta": metadata(), "params": vars(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=1, sort_keys=True)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+    prog = os.path.basename(sys.argv[0])
+    if sys.version_info.major <= 2:
+        raise ValueError("{} requires python version 3 or higher".format(prog))
+
+    parser = ArgumentParser(
+        description="Benchmark adapter prediction on simulated libraries")
+    parser.add_argument("--scales",
+        metavar="N[,N...]",
+        default="10000,100000,1000000",
+        help="numbers of reads in simulated libraries, up to e.g. "
+             "10000000 (default: %(default)s)")
+    parser.add_argument("--formats",
+        metavar="FORMAT[,FORMAT...]",
+        default="plain,gz",
+        help="file formats of libraries: {} (default: %(default)s)".format(
+             ",".join(sorted(FORMATS))))
+    parser.add_argument("--stages",
+        metavar="STAGE[,STAGE...]",
+        default=",".join(STAGES),
+        help="stages to time (default: %(default)s)")
+    parser.add_argument("--repeat",
+        metavar="INT",
+        type=int, default=1,
+        help="number of runs of each stage (default: %(default)s)")
+    parser.add_argument("--output",
+        metavar="JSON",
+        default=None,
+        help="file to write results in JSON")
+    parser.add_argument("--compare",
+        metavar="JSON",
+        default=None,
+        help="results of a previous run to compare wall times with")
+    parser.add_argument("--work-dir",
+        metavar="DIRECTORY",
+        default="/tmp/dnapi_bench",
+        help="directory to keep simulated libraries (default: %(default)s)")
+
+    simop = parser.add_argument_group("simulated libraries")
+    simop.add_argument("--adapter",
+        metavar="SEQ",
+        default=ADAPTER,
+        help="3'adapter sequence (default: %(default)s)")
+    simop.add_argument("--read-len",
+        metavar="BP",
+        type=int, default=50,
+        help="read length (default: %(default)s)")
+    simop.add_argument("--insert-mean",
+        metavar="BP",
+        type=float, default=22,
+        help="mean insert length (default: %(default)s)")
+    simop.add_argument("--insert-sd",
+        metavar="BP",
+        type=float, default=3,
+        help="standard deviation of insert lengths (default: %(default)s)")
+    simop.add_argument("--error-rate",
+        metavar="FLOAT",
+        type=float, default=0.001,
+        help="substitution error rate per base (default: %(default)s)")
+    simop.add_argument("--polya-rate",
+        metavar="FLOAT",
+        type=float, default=0.02,
+        help="fraction of reads with poly-A tails (default: %(default)s)")
+    simop.add_argument("--low-comp-rate",
+        metavar="FLOAT",
+        type=float, default=0.02,
+        help="fraction of dinucleotide repeat reads (default: %(default)s)")
+    simop.add_argument("--seed",
+        metavar="INT",
+        type=int, default=0,
+        help="random seed (default: %(default)s)")
+
+    args = parser.parse_args()
+
+    try:
+        benchmark(args)
+    except KeyboardInterrupt: pass
+    except Exception as e:
+        sys.exit(prog + ": error: " + str(e))
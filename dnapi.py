@@ -4,24 +4,53 @@ import sys
 import os.path
 import re
 import uuid
+import json
 import signal
+import cProfile
 import fileinput
 import subprocess
 from argparse import ArgumentParser
 
 import dnapilib
+from dnapilib import io_utils
+from dnapilib import stats
 from dnapilib.io_utils import get_file_obj
+from dnapilib.io_utils import DECOMPRESS, DECOMPRESS_MODES
+from dnapilib.sampling import SAMPLING_MODES
+from dnapilib.cache import KmerCache
+from dnapilib.batch import sample_name
+from dnapilib.batch import unique_samples
+from dnapilib.batch import read_manifest
+from dnapilib.batch import batch_prediction
+from dnapilib.batch import format_result
+from dnapilib.batch import TSV_HEADER
 from dnapilib.apred import adapter_prediction
 from dnapilib.apred import iterative_adapter_prediction
+from dnapilib.apred import adaptive_adapter_prediction
+from dnapilib.apred import ADAPTIVE_BATCH, ADAPTIVE_PATIENCE
+from dnapilib.apred import ADAPTIVE_MAX_READS
+from dnapilib.apred import check_approx_counts
+from dnapilib.apred import Predictor
+from dnapilib.apred import tee_prediction
+from dnapilib import kmer
+from dnapilib import exhaust
+from dnapilib.kmer import SKETCH_WIDTH, SKETCH_CAPACITY
+from dnapilib.kmer import LOW_COMPLEXITY, COMPLEXITY_MEASURES
+from dnapilib.apred import count_fastq_kmers
+from dnapilib.apred import assemble_adapters
+from dnapilib.trim import TRIM_FORMATS
+from dnapilib.collapse import ReadCollapser
+from dnapilib.pipeline import qc_pipeline
 from dnapilib.exhaust import rm_temp_dir
 from dnapilib.exhaust import fastq_input_prep
-from dnapilib.exhaust import map_clean_reads
+from dnapilib.exhaust import map_candidates
 from dnapilib.exhaust import make_stats_report
 
 
 TEMP_DIR = None
 MAP_TO_GENOME = False
 SAMPLE_NUM = 50000
+SAMPLE_STATS = []
 
 
 def convert_interval(s_in, s_op, func):
@@ -52,15 +81,31 @@ def parse_args():
 
     """
     parser = ArgumentParser(
-                 usage="%(prog)s [options] FASTQ",
+                 usage="%(prog)s [options] FASTQ [FASTQ ...]",
                  description="Predict or evaluate 3'adapter sequence(s)",
                  epilog="Report bug to: Junko Tsuji <jnktsj@gmail.com>")
 
     parser.add_argument("FASTQ",
-        type=str,
-        help="including stdin or compressed file {zip,gz,tar,bz}")
+        type=str, nargs="*",
+        help="including stdin or compressed file {zip,gz,tar,bz,xz,zst}; "
+             "multiple FASTQs are predicted in batch mode")
     parser.add_argument("--version", action="version",
         version="%(prog)s {}".format(dnapilib.__version__))
+    parser.add_argument("--stats-json",
+        metavar="FILE",
+        default=None,
+        help="write wall/CPU time, reads, bytes and peak memory of each "
+             "stage in JSON ('-' for stderr)")
+    parser.add_argument("--profile",
+        metavar="FILE",
+        default=None,
+        help="write cProfile statistics of the run (see pstats)")
+    parser.add_argument("--decompress",
+        choices=DECOMPRESS_MODES,
+        default=DECOMPRESS,
+        help="decompression of compressed FASTQ: 'auto' uses a parallel "
+             "command (pigz, pbzip2, zstd, ...) if available or a "
+             "background thread (default: %(default)s)")
 
     predop = parser.add_argument_group("adapter prediction parameters")
     predop.add_argument("-k",
@@ -76,12 +121,160 @@ def parse_args():
     predop.add_argument("--show-all",
         action="store_true",
         help="show other candidates if any")
+    predop.add_argument("--low-complexity",
+        metavar="MEASURE[,MEASURE...]",
+        default=",".join(LOW_COMPLEXITY),
+        help="measures to filter low-complexity k-mers: {} "
+             "(default: %(default)s)".format(", ".join(COMPLEXITY_MEASURES)))
+    predop.add_argument("--sampling",
+        choices=SAMPLING_MODES,
+        default="head",
+        help="how to sample reads for prediction: the first reads, "
+             "uniformly from the whole file, or at random offsets of "
+             "uncompressed/BGZF files (default: %(default)s)")
+    predop.add_argument("--seed",
+        metavar="INT",
+        default=None, type=int,
+        help="random seed for read sampling")
+    predop.add_argument("--adaptive",
+        action="store_true",
+        help="count reads in batches and stop once the top adapter and "
+             "its score margin are stable, instead of using a fixed "
+             "number of reads")
+    predop.add_argument("--batch-reads",
+        metavar="INT",
+        default=ADAPTIVE_BATCH, type=int,
+        help="reads per batch in adaptive mode (default: %(default)s)")
+    predop.add_argument("--stable-batches",
+        metavar="INT",
+        default=ADAPTIVE_PATIENCE, type=int,
+        help="number of batches the prediction must stay stable for "
+             "in adaptive mode (default: %(default)s)")
+    predop.add_argument("--max-reads",
+        metavar="INT",
+        default=ADAPTIVE_MAX_READS, type=int,
+        help="maximum number of reads in adaptive mode "
+             "(default: %(default)s)")
+
+    approxop = parser.add_argument_group("approximate k-mer counting")
+    approxop.add_argument("--approx",
+        action="store_true",
+        help="count k-mers approximately in fixed memory with a "
+             "count-min sketch and a set of heavy-hitter k-mers "
+             "(requires numpy)")
+    approxop.add_argument("--sketch-width",
+        metavar="INT",
+        default=SKETCH_WIDTH, type=int,
+        help="counters per row of the sketch, rounded up to a power "
+             "of 2 (default: %(default)s)")
+    approxop.add_argument("--heavy-hitters",
+        metavar="INT",
+        default=SKETCH_CAPACITY, type=int,
+        help="number of most frequent k-mers to keep "
+             "(default: %(default)s)")
+    approxop.add_argument("--approx-check",
+        action="store_true",
+        help="count k-mers both exactly and approximately, and report "
+             "the errors of the top k-mers instead of predicting")
+
+    cacheop = parser.add_argument_group("k-mer cache")
+    cacheop.add_argument("--cache-dir",
+        metavar="DIRECTORY",
+        default=None,
+        help="directory to keep k-mer counts of FASTQs, so later runs "
+             "with other -r or modes on the same FASTQ skip counting "
+             "(e.g. ~/.cache/dnapi; requires numpy)")
+    cacheop.add_argument("--cache-size",
+        metavar="MB",
+        default=1024, type=int,
+        help="maximum size of the k-mer cache; least recently used "
+             "counts are removed (default: %(default)s)")
+
+    teeop = parser.add_argument_group("streaming prediction")
+    teeop.add_argument("--tee",
+        metavar="FILE",
+        default=None,
+        help="copy all input FASTQ records to FILE ('-' for stdout) "
+             "while predicting, and write the prediction to stderr")
+    teeop.add_argument("--prediction-json",
+        metavar="FILE",
+        default=None,
+        help="write the prediction in JSON to FILE instead of stderr "
+             "in --tee mode")
+
+    trimop = parser.add_argument_group("adapter trimming")
+    trimop.add_argument("--trim",
+        metavar="FILE",
+        default=None,
+        help="write reads with the predicted 3'adapter (or the first "
+             "--adapter-seq) trimmed to FILE ('-' for stdout), using the "
+             "adapter removal parameters below, in a single pass over "
+             "FASTQ; by default only trimmed reads of --min-len 16 to "
+             "--max-len 36 bases are written")
+    trimop.add_argument("--trim-format",
+        choices=TRIM_FORMATS,
+        default="fastq",
+        help="output format of trimmed reads (default: %(default)s)")
+    trimop.add_argument("--trim-mismatches",
+        metavar="INT",
+        default=0, type=int,
+        help="number of mismatches allowed in the 3'adapter match "
+             "(default: %(default)s)")
+    trimop.add_argument("--trim-keep-untrimmed",
+        action="store_true",
+        help="also write reads without the 3'adapter, which are "
+             "dropped by default")
+    trimop.add_argument("--qual-cutoff",
+        metavar="SCORE",
+        default=0, type=int,
+        help="trim low quality 3'ends as in BWA with a Phred quality "
+             "cutoff before adapter prediction and trimming "
+             "(default: %(default)s, no quality trimming)")
+    trimop.add_argument("--qual-base",
+        choices=("auto", "33", "64"),
+        default="auto",
+        help="ASCII-encoded quality offset for --qual-cutoff, or 'auto' "
+             "to guess it from the first reads (default: %(default)s)")
+
+    batchop = parser.add_argument_group("batch prediction of multiple FASTQs")
+    batchop.add_argument("--manifest",
+        metavar="FILE",
+        default=None,
+        help="file listing FASTQs, one per line as 'FASTQ' or "
+             "'SAMPLE<tab>FASTQ'")
+    batchop.add_argument("--jobs",
+        metavar="INT",
+        default=None, type=int,
+        help="number of worker processes (default: number of CPUs)")
+    batchop.add_argument("--batch-format",
+        choices=("tsv", "json"),
+        default="tsv",
+        help="output format of batch results streamed as each FASTQ "
+             "finishes (default: %(default)s)")
 
     exhaop = parser.add_argument_group("exhaustive adapter search")
     exhaop.add_argument("--map-command",
         metavar="COMMAND",
         default=None,
         help="read mapping command to be tested")
+    exhaop.add_argument("--map-jobs",
+        metavar="INT",
+        default=None, type=int,
+        help="number of adapter candidates to clip and map at the same "
+             "time (default: number of CPUs)")
+    exhaop.add_argument("--map-stream",
+        action="store_true",
+        help="count mapping results through a pipe while the mapper "
+             "runs instead of writing temporary SAM/BAM files")
+    exhaop.add_argument("--collapse-memory",
+        metavar="MB",
+        default=None, type=int,
+        help="memory for collapsing clean reads of each run (or reads "
+             "of --trim-format collapsed), beyond which they are sorted "
+             "and spilled to the temporary directory (default: no limit)")
+    exhaop.add_argument("--collapse-packed",
+        action="store_true",
+        help="keep collapsed reads packed in 2 bits per base")
     exhaop.add_argument("--subsample-rate",
         metavar="FLOAT",
         default=1.0, type=float,
@@ -113,11 +306,13 @@ def parse_args():
     adrmop.add_argument("--min-len",
         metavar="LENGTH",
         default=16, type=int,
-        help="minimum read length to keep for mapping (default: %(default)s)")
+        help="minimum read length to keep for mapping or --trim "
+             "(default: %(default)s)")
     adrmop.add_argument("--max-len",
         metavar="LENGTH",
         default=36, type=int,
-        help="maximum read length to keep for mapping (default: %(default)s)")
+        help="maximum read length to keep for mapping or --trim "
+             "(default: %(default)s)")
     adrmop.add_argument("--trim-5p",
         metavar="LENGTH",
         default=0, type=int,
@@ -131,6 +326,71 @@ def parse_args():
 
     args = parser.parse_args()
 
+    if not args.FASTQ and not args.manifest:
+        parser.error("the following arguments are required: FASTQ")
+    if args.jobs is not None and args.jobs <= 0:
+        raise Exception("bad value: --jobs")
+    for m in args.low_complexity.split(","):
+        if m not in COMPLEXITY_MEASURES:
+            raise Exception("bad value: --low-complexity {}".format(m))
+    if args.sketch_width <= 0:
+        raise Exception("bad value: --sketch-width")
+    if args.heavy_hitters <= 0:
+        raise Exception("bad value: --heavy-hitters")
+    if args.cache_size <= 0:
+        raise Exception("bad value: --cache-size")
+    if args.adaptive:
+        if args.batch_reads <= 0:
+            raise Exception("bad value: --batch-reads")
+        if args.stable_batches <= 0:
+            raise Exception("bad value: --stable-batches")
+        if args.max_reads <= 0:
+            raise Exception("bad value: --max-reads")
+    if args.map_command and (len(args.FASTQ) != 1 or args.manifest):
+        raise Exception("--map-command takes a single FASTQ")
+    if args.approx_check and (len(args.FASTQ) != 1 or args.manifest):
+        raise Exception("--approx-check takes a single FASTQ")
+    if args.tee:
+        if len(args.FASTQ) != 1 or args.manifest:
+            raise Exception("--tee takes a single FASTQ")
+        if args.map_command or args.approx_check:
+            raise Exception("--tee can't be used with --map-command "
+                            "or --approx-check")
+        if args.sampling != "head":
+            raise Exception("--tee only supports --sampling head")
+    elif args.prediction_json:
+        raise Exception("--prediction-json requires --tee")
+    if args.trim:
+        if len(args.FASTQ) != 1 or args.manifest:
+            raise Exception("--trim takes a single FASTQ")
+        if args.map_command or args.approx_check or args.tee:
+            raise Exception("--trim can't be used with --map-command, "
+                            "--approx-check or --tee")
+        if args.approx or args.cache_dir:
+            raise Exception("--trim can't be used with --approx "
+                            "or --cache-dir")
+        if args.sampling != "head":
+            raise Exception("--trim only supports --sampling head")
+        if args.qual_cutoff < 0:
+            raise Exception("bad value: --qual-cutoff")
+        if args.trim_mismatches < 0 or \
+           args.trim_mismatches >= args.prefix_match:
+            raise Exception("bad value: --trim-mismatches")
+
+    if args.map_command or args.trim:
+        if args.prefix_match <= 0:
+            raise Exception("bad value: --prefix-match")
+        if args.min_len <= 0:
+            raise Exception("bad value: --min-len")
+        if args.max_len <= 0:
+            raise Exception("bad value: --max-len")
+        if args.collapse_memory is not None and args.collapse_memory <= 0:
+            raise Exception("bad value: --collapse-memory")
+        if args.trim_5p < 0:
+            raise Exception("bad value: --trim-5p")
+        if args.trim_3p < 0:
+            raise Exception("bad value: --trim-3p")
+
     if args.map_command:
         err_find = "can't find {}"
         soft = os.path.expanduser(args.map_command.split()[0])
@@ -146,16 +406,8 @@ def parse_args():
             raise Exception("can't locate input argument: @in")
         if not re.findall("@out", args.map_command):
             raise Exception("can't locate output argument: @out")
-        if args.prefix_match <= 0:
-            raise Exception("bad value: --prefix-match")
-        if args.min_len <= 0:
-            raise Exception("bad value: --min-len")
-        if args.max_len <= 0:
-            raise Exception("bad value: --max-len")
-        if args.trim_5p < 0:
-            raise Exception("bad value: --trim-5p")
-        if args.trim_3p < 0:
-            raise Exception("bad value: --trim-3p")
+        if args.map_jobs is not None and args.map_jobs <= 0:
+            raise Exception("bad value: --map-jobs")
         if args.subsample_rate <= 0 or 1 < args.subsample_rate:
             raise Exception("bad subsampling rate")
         global MAP_TO_GENOME
@@ -164,21 +416,208 @@ def parse_args():
     return args
 
 
+def tee_mode(args, fastq, Ks, Rs):
+    """Copy FASTQ to --tee while predicting, and report the
+       prediction to stderr or --prediction-json.
+
+    """
+    def report(predictor):
+        adapts = predictor.predict()
+        if not args.show_all:
+            adapts = adapts[:1]
+        if args.prediction_json:
+            out = {"fastq": fastq, "reads": predictor.read_count,
+                   "adapters": [{"seq": a, "score": round(c, 2)}
+                                for a, c in adapts]}
+            if args.adaptive:
+                out["converged"] = predictor.converged
+            with open(args.prediction_json, "w") as f:
+                f.write(json.dumps(out) + "\n")
+        else:
+            for x in adapts:
+                sys.stderr.write("3'adapter={}\tscore={:.2f}\n".format(*x))
+            sys.stderr.flush()
+
+    adaptive = None
+    if args.adaptive:
+        adaptive = {"batch_size": args.batch_reads,
+                    "patience": args.stable_batches,
+                    "max_reads": args.max_reads}
+    fq_obj = get_file_obj(fastq, binary=True)
+    if args.tee == "-":
+        out = sys.stdout.buffer
+    else:
+        out = open(args.tee, "wb")
+    tee_prediction(fq_obj, out, Predictor(Ks, Rs), report,
+                   SAMPLE_NUM, adaptive)
+    fq_obj.close()
+    if out is not sys.stdout.buffer:
+        out.close()
+
+
+def trim_mode(args, fastq, Ks, Rs):
+    """Quality-trim reads, predict the 3'adapter (unless given) and
+       trim it from all reads in a single pass over FASTQ.
+
+    """
+    info = sys.stderr if args.trim == "-" else sys.stdout
+    def report(result):
+        if result["encoding"]:
+            sys.stderr.write("quality encoding: {}\n".format(
+                                 result["encoding"]))
+        info.write(result["adapter"] + "\n")
+        info.flush()
+
+    adaptive = None
+    if args.adaptive:
+        adaptive = {"batch_size": args.batch_reads,
+                    "patience": args.stable_batches,
+                    "max_reads": args.max_reads}
+    qual_base = args.qual_base
+    if qual_base != "auto":
+        qual_base = int(qual_base)
+    collapser = None
+    if args.trim_format == "collapsed":
+        collapser = ReadCollapser(exhaust.COLLAPSE_MEMORY, args.temp_dir,
+                                  args.collapse_packed)
+    fq_obj = get_file_obj(fastq, binary=True)
+    out = io_utils.get_out_obj(args.trim)
+    result = qc_pipeline(fq_obj, out, Predictor(Ks, Rs),
+                         args.seq[0] if args.seq else None,
+                         args.prefix_match, args.trim_mismatches,
+                         args.qual_cutoff, qual_base,
+                         args.trim_5p, args.trim_3p, args.min_len,
+                         args.max_len, args.trim_keep_untrimmed,
+                         args.trim_format, SAMPLE_NUM, adaptive, report,
+                         collapser)
+    fq_obj.close()
+    if out is not sys.stdout.buffer:
+        out.close()
+    sys.stderr.write("reads: {reads}\ttrimmed: {trimmed}\t"
+                     "written: {written}\n".format(**result))
+
+
+def write_stats(args, stats_file):
+    """Write statistics of the run in JSON.
+
+    """
+    out = {"dnapi": dnapilib.__version__,
+           "fastq": args.FASTQ,
+           "stats": stats.STATS.report()}
+    if SAMPLE_STATS:
+        out["samples"] = SAMPLE_STATS
+    if stats_file == "-":
+        sys.stderr.write(json.dumps(out) + "\n")
+    else:
+        with open(stats_file, "w") as f:
+            json.dump(out, f, indent=1)
+            f.write("\n")
+
+
 def main():
     args = parse_args()
-    fastq = args.FASTQ
+    if args.stats_json:
+        stats.enable()
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        run(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.stats_json:
+            write_stats(args, args.stats_json)
+
+
+def run(args):
+    io_utils.DECOMPRESS = args.decompress
+    kmer.LOW_COMPLEXITY = tuple(args.low_complexity.split(","))
+    if args.collapse_memory:
+        exhaust.COLLAPSE_MEMORY = args.collapse_memory * 1024 * 1024
+    exhaust.COLLAPSE_PACKED = args.collapse_packed
 
     Ks = convert_interval(args.k, "-k", int)
     Rs = convert_interval(args.r, "-r", float)
+    approx = None
+    if args.approx or args.approx_check:
+        approx = {"width": args.sketch_width,
+                  "capacity": args.heavy_hitters}
+    cache = None
+    if args.cache_dir:
+        cache = KmerCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    samples = [(sample_name(fq), fq) for fq in args.FASTQ]
+    if args.manifest:
+        samples += read_manifest(args.manifest)
+    samples = unique_samples(samples)
+    if len(samples) > 1 or args.manifest:
+        if args.batch_format == "tsv":
+            print(TSV_HEADER)
+        adaptive = None
+        if args.adaptive:
+            adaptive = {"max_reads": args.max_reads,
+                        "batch_size": args.batch_reads,
+                        "patience": args.stable_batches}
+        for result in batch_prediction(samples, Rs, Ks, SAMPLE_NUM,
+                                       args.jobs, args.sampling, args.seed,
+                                       adaptive, cache, approx,
+                                       bool(args.stats_json)):
+            if args.stats_json:
+                SAMPLE_STATS.append({"sample": result[0],
+                                     "fastq": result[1],
+                                     "stats": result[4]})
+            print(format_result(result, args.batch_format, args.show_all))
+            sys.stdout.flush()
+        return
+    fastq = args.FASTQ[0]
+
+    if args.tee:
+        tee_mode(args, fastq, Ks, Rs)
+        return
+
+    if args.approx_check:
+        approx_stats = check_approx_counts(fastq, Ks, SAMPLE_NUM,
+                                           args.sampling, args.seed, approx)
+        print("# k\ttop_kmers\trecall\tmax_error\tmax_relative_error"
+              "\terror_bound")
+        for k in Ks:
+            print("{}\t{top}\t{recall:.4f}\t{max_error}\t"
+                  "{max_relative_error:.4f}\t{error_bound}".format(
+                      k, **approx_stats[k]))
+        return
+
+    if args.trim:
+        trim_mode(args, fastq, Ks, Rs)
+        return
 
     if not MAP_TO_GENOME:
-        if len(Ks) > 1 or len(Rs) > 1:
-            adapts = iterative_adapter_prediction(fastq, Rs, Ks, SAMPLE_NUM)
+        if args.adaptive:
+            predictor = adaptive_adapter_prediction(
+                            fastq, Rs, Ks, args.max_reads, args.batch_reads,
+                            args.stable_batches, sampling=args.sampling,
+                            seed=args.seed)
+            adapts = predictor.predict()
+            if not predictor.converged:
+                sys.stderr.write("warning: prediction did not converge "
+                                 "in {} reads\n".format(predictor.read_count))
+        elif len(Ks) > 1 or len(Rs) > 1:
+            adapts = iterative_adapter_prediction(
+                         fastq, Rs, Ks, SAMPLE_NUM,
+                         sampling=args.sampling, seed=args.seed,
+                         cache=cache, approx=approx)
         else:
-            adapts = adapter_prediction(fastq, Rs[0], Ks[0], SAMPLE_NUM)
+            adapts = adapter_prediction(
+                         fastq, Rs[0], Ks[0], SAMPLE_NUM,
+                         sampling=args.sampling, seed=args.seed,
+                         cache=cache, approx=approx)
         if args.show_all:
             for x in adapts:
                 print("{}\tscore={:.2f}".format(*x))
+        elif not adapts:
+            raise Exception("no adapters predicted")
         else:
             print(adapts[0][0])
 
@@ -199,11 +638,22 @@ def main():
             msg = "warning: predicted adapter is too short (<{0}): '{1}'\n" \
                 + "warning: '{1}' will not be further investigated\n"
             params = {}
+            # Count the input FASTQ itself unless it is subsampled,
+            # so its counts are cached across runs.
+            if args.subsample_rate == 1 and original_fastq != "-":
+                counter = count_fastq_kmers(original_fastq, Ks, SAMPLE_NUM,
+                                            args.sampling, args.seed,
+                                            cache=cache, approx=approx)
+            else:
+                counter = count_fastq_kmers(fastq, Ks, SAMPLE_NUM,
+                                            args.sampling, args.seed,
+                                            approx=approx)
             for k in Ks:
+                freq = counter.frequency(k)
                 for r in Rs:
-                    aout = adapter_prediction(fastq, r, k, SAMPLE_NUM)[0][0]
+                    aout = assemble_adapters(freq, r, k)[0][0]
                     if len(aout) < args.prefix_match:
-                        sys.stderr.write(msg.format(l, s))
+                        sys.stderr.write(msg.format(args.prefix_match, aout))
                         continue
                     aseq = aout[: args.prefix_match+5]
                     params.setdefault(aseq,[]).append("{}:{:.1f}".format(k,r))
@@ -215,12 +665,14 @@ def main():
         if not adapts:
             raise Exception("no valid adapters to further process")
 
+        mapped = map_candidates(
+                     fastq, [a[:args.prefix_match] for a in adapts],
+                     args.trim_5p, args.trim_3p, args.min_len, args.max_len,
+                     args.map_command, TEMP_DIR, args.map_jobs,
+                     args.map_stream)
         table = []
         for i, aseq in enumerate(adapts):
-            cnts = map_clean_reads(
-                       fastq, aseq[:args.prefix_match], args.trim_5p,
-                       args.trim_3p, args.min_len, args.max_len,
-                       args.map_command, TEMP_DIR)
+            cnts = mapped[aseq[:args.prefix_match]]
             read_stats = [c / total_read * 100 for c in cnts]
             table.append([aseq, cnts[0], read_stats[0],
                           cnts[1], read_stats[1], setstr[i]])
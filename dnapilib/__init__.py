@@ -1,4 +1,6 @@
 __version__ = "1.1"
 
-__all__ = ["io_utils", "kmer", "apred", "exhaust"]
+__all__ = ["io_utils", "kmer", "apred", "exhaust", "sampling", "batch",
+           "cache", "simulate", "stats", "trim", "quality",
+           "pipeline", "collapse", "store"]
 
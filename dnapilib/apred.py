@@ -2,45 +2,127 @@
 
 """
 
+import io
+import random
+from itertools import islice
 from operator import itemgetter
 
-from dnapilib.io_utils import get_file_obj, fastq_sequence
-from dnapilib.kmer import count_kmers, filter_kmers, assemble_kmers
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
+from dnapilib.io_utils import get_file_obj, fastq_sequence, fastq_lines
+from dnapilib.io_utils import CHUNK_SIZE
+from dnapilib.kmer import KmerCounter, filter_kmers, assemble_kmers
+from dnapilib.kmer import SketchCounter, compare_frequency
+from dnapilib.sampling import sample_sequences
+from dnapilib.cache import CachedCounter
 
-def adapter_prediction(fastq, ratio, kmer_len, sample_num):
-    """Return a list of predicted adapters.
 
-       Predict 3' adapter sequence with a combination of k and R.
+ADAPTIVE_BATCH = 10000
+ADAPTIVE_PATIENCE = 3
+ADAPTIVE_TOLERANCE = 0.05
+ADAPTIVE_MAX_READS = 1000000
+
+
+def count_fastq_kmers(fastq, kmer_lens, sample_num,
+                      sampling="head", seed=None, cache=None, approx=None):
+    """Return a k-mer counter filled with k-mers of all given
+       lengths in a single pass over the sampled reads.
+
+       See dnapilib.sampling for the sampling modes. If cache is
+       a KmerCache, cached tables are used and FASTQ is only read
+       for k-mer lengths that are not cached yet. If approx is a
+       dictionary of SketchCounter parameters, k-mers are counted
+       approximately in fixed memory, without the cache.
+    """
+    if approx is not None:
+        cache = None
+    keys = {}
+    freqs = {}
+    read_count = 0
+    if cache is not None:
+        for k in kmer_lens:
+            keys[k] = cache.key(fastq, k, sample_num, sampling, seed)
+            hit = keys[k] and cache.load(keys[k])
+            if hit:
+                freqs[k], read_count = hit
+        kmer_lens = [k for k in kmer_lens if k not in freqs]
+        if not kmer_lens:
+            return CachedCounter(freqs, read_count)
+
+    if approx is not None:
+        counter = SketchCounter(kmer_lens, **approx)
+    else:
+        counter = KmerCounter(kmer_lens)
+    if sampling != "head":
+        counter.update(sample_sequences(fastq, sample_num, sampling, seed))
+    else:
+        fq_obj = get_file_obj(fastq, binary=True)
+        counter.update(fastq_sequence(fq_obj), sample_num)
+        fq_obj.close()
+    if cache is None:
+        return counter
+    for k in kmer_lens:
+        freqs[k] = counter.frequency(k)
+        if keys[k]:
+            cache.store(keys[k], freqs[k], counter.read_count)
+    return CachedCounter(freqs, counter.read_count)
+
+
+def check_approx_counts(fastq, kmer_lens, sample_num, sampling="head",
+                        seed=None, approx=None, top=100):
+    """Return a dictionary of k-mer lengths to comparisons of
+       approximate and exact counts of the top k-mers, together
+       with the error bound of the sketch.
+
+       See compare_frequency for the comparison.
+    """
+    exact = count_fastq_kmers(fastq, kmer_lens, sample_num, sampling, seed)
+    sketch = count_fastq_kmers(fastq, kmer_lens, sample_num, sampling, seed,
+                               approx=approx or {})
+    stats = {}
+    for k in kmer_lens:
+        stats[k] = compare_frequency(sketch.frequency(k),
+                                     exact.frequency(k), top)
+        stats[k]["error_bound"] = round(sketch.error_bound(k), 2)
+    return stats
+
+
+def assemble_adapters(freq, ratio, kmer_len):
+    """Return a list of predicted adapters from
+       sorted k-mer frequency.
+
     """
-    fq_obj = get_file_obj(fastq)
-    fq_seq = fastq_sequence(fq_obj)
-    freq = count_kmers(fq_seq, kmer_len, sample_num)
     clean = filter_kmers(freq, kmer_len, ratio)
-    assembl = sorted(assemble_kmers(clean, kmer_len//2),
-                     key=itemgetter(1), reverse=True)
-    fq_obj.close()
-    return assembl
+    return sorted(assemble_kmers(clean, kmer_len//2),
+                  key=itemgetter(1), reverse=True)
 
-def iterative_adapter_prediction(fastq, ratios, kmer_lens,
-                                 sample_num, keep_len=12):
+
+def adapter_prediction(fastq, ratio, kmer_len, sample_num,
+                       sampling="head", seed=None, cache=None,
+                       approx=None):
     """Return a list of predicted adapters.
 
-       Iteratively predict 3' adapter sequence with different
-       combinations of k and R.
+       Predict 3' adapter sequence with a combination of k and R.
     """
-    fq_seq = []
-    fq_obj = get_file_obj(fastq)
-    for i, s in enumerate(fastq_sequence(fq_obj)):
-        if i == sample_num:
-            break
-        fq_seq.append(s)
-    fq_obj.close()
+    counter = count_fastq_kmers(fastq, [kmer_len], sample_num,
+                                sampling, seed, cache, approx)
+    return assemble_adapters(counter.frequency(kmer_len), ratio, kmer_len)
 
+
+def rank_adapters(counter, ratios, kmer_lens, keep_len=12):
+    """Return a list of predicted adapters from a k-mer counter
+       filled with k-mers of all given lengths.
+
+       Adapters predicted with each combination of k and R are
+       merged and re-assembled as in iterative prediction.
+    """
     collection = {}
     for kmer_len in kmer_lens:
         curated = {}
-        freq = count_kmers(fq_seq, kmer_len, sample_num)
+        freq = counter.frequency(kmer_len)
         for ratio in ratios:
             clean = filter_kmers(freq, kmer_len, ratio)
             assembl = assemble_kmers(clean, kmer_len//2)
@@ -49,7 +131,230 @@ def iterative_adapter_prediction(fastq, ratios, kmer_lens,
                 curated[key] = max(curated.get(key,0), c)
         for s, c in curated.items():
             collection[s] = round(collection.get(s,0)+c, 4)
+    if not collection:
+        return []
     asmbl_min_len = min(map(len, collection.keys()))
     assembl = sorted(assemble_kmers(list(collection.items()), asmbl_min_len//2),
                      key=itemgetter(1), reverse=True)
     return assembl
+
+
+def iterative_adapter_prediction(fastq, ratios, kmer_lens,
+                                 sample_num, keep_len=12,
+                                 sampling="head", seed=None, cache=None,
+                                 approx=None):
+    """Return a list of predicted adapters.
+
+       Iteratively predict 3' adapter sequence with different
+       combinations of k and R.
+    """
+    counter = count_fastq_kmers(fastq, kmer_lens, sample_num,
+                                sampling, seed, cache, approx)
+    return rank_adapters(counter, ratios, kmer_lens, keep_len)
+
+
+def read_sequences(reads):
+    """Return an iterable of read sequences in strings.
+
+       reads can be an iterable of str or bytes sequences, a
+       buffer (bytes, bytearray, memoryview or str) of FASTQ
+       records or of one sequence per line, or a NumPy array of
+       byte strings or of uint8 codes with one read per row.
+    """
+    if isinstance(reads, (bytes, bytearray, memoryview)):
+        reads = bytes(reads).decode("latin-1")
+    if isinstance(reads, str):
+        if reads.lstrip().startswith("@"):
+            return (x for lines in fastq_lines(io.StringIO(reads))
+                    for x in lines[1::4])
+        return reads.split()
+    if np is not None and isinstance(reads, np.ndarray):
+        if reads.dtype.kind == "U":
+            return reads.ravel().tolist()
+        if reads.dtype.itemsize == 1 and reads.dtype.kind in "uiS":
+            if reads.ndim == 1 and reads.dtype.kind != "S":
+                return read_sequences(reads.tobytes())
+            if reads.ndim == 2:
+                rows = np.ascontiguousarray(reads).view(np.uint8)
+                reads = rows.view("S{}".format(rows.shape[1])).ravel()
+        if reads.dtype.kind != "S":
+            raise Exception("bad read array: {}".format(reads.dtype))
+        return [x.decode("latin-1") for x in reads.ravel().tolist()]
+    return (x.decode("latin-1") if isinstance(x, bytes) else x
+            for x in reads)
+
+
+class Predictor(object):
+    """Predict 3' adapters from reads held in memory.
+
+       K-mer tables are kept across calls, so reads can be fed
+       incrementally and the current prediction taken at any
+       time. With a single k and a single R, adapters are
+       predicted as in adapter_prediction, otherwise as in
+       iterative_adapter_prediction.
+    """
+
+    def __init__(self, kmer_lens=(9, 11), ratios=(1.2, 1.3, 1.4),
+                 keep_len=12):
+        self.kmer_lens = sorted(set(kmer_lens))
+        self.ratios = list(ratios)
+        if not self.ratios:
+            raise Exception("bad filtering ratio")
+        self.keep_len = keep_len
+        self.counter = KmerCounter(self.kmer_lens)
+        self.converged = False
+
+    @property
+    def read_count(self):
+        return self.counter.read_count
+
+    def feed(self, reads, sample_num=None):
+        """Count k-mers in reads up to sample_num, and return
+           the number of the reads counted.
+
+           See read_sequences for the accepted types of reads.
+        """
+        return self.counter.update(read_sequences(reads), sample_num)
+
+    def feed_until_stable(self, reads, batch_size=ADAPTIVE_BATCH,
+                          patience=ADAPTIVE_PATIENCE,
+                          tolerance=ADAPTIVE_TOLERANCE, max_reads=None):
+        """Feed reads in batches until the top adapter and its score
+           margin are stable, and return the number of reads counted.
+
+           After each batch, adapters are predicted from the running
+           k-mer totals. Feeding stops once the top adapter stays the
+           same and the margin of its score over the second one
+           changes by at most tolerance (relative) for patience
+           batches in a row, or after max_reads reads. converged
+           tells which of the two happened.
+        """
+        if batch_size <= 0 or patience <= 0:
+            raise Exception("bad batch size or patience")
+        seqs = iter(read_sequences(reads))
+        if max_reads is not None:
+            seqs = islice(seqs, max_reads)
+        self.converged = False
+        prev = None
+        stable = 0
+        num = 0
+        while stable < patience:
+            n = self.counter.update(seqs, batch_size)
+            if not n:
+                break
+            num += n
+            adapts = self.predict()
+            second = adapts[1][1] if len(adapts) > 1 else 0.0
+            top = (adapts[0][0][:self.keep_len], adapts[0][1] - second)
+            if (prev is not None and top[0] == prev[0] and
+                    abs(top[1] - prev[1]) <= tolerance * abs(prev[1])):
+                stable += 1
+            else:
+                stable = 0
+            prev = top
+        self.converged = stable >= patience
+        return num
+
+    def predict(self):
+        """Return a list of predicted adapters sorted by the scores,
+           or an empty list if no reads have been fed or all k-mers
+           are filtered out.
+
+        """
+        if not self.read_count:
+            return []
+        if len(self.kmer_lens) > 1 or len(self.ratios) > 1:
+            return rank_adapters(self.counter, self.ratios,
+                                 self.kmer_lens, self.keep_len)
+        k = self.kmer_lens[0]
+        return assemble_adapters(self.counter.frequency(k), self.ratios[0], k)
+
+    def best(self):
+        """Return the predicted adapter with the highest score,
+           or None if no adapter is predicted.
+
+        """
+        adapts = self.predict()
+        return adapts[0][0] if adapts else None
+
+    def reset(self):
+        """Discard all counted k-mers.
+
+        """
+        self.counter = KmerCounter(self.kmer_lens)
+        self.converged = False
+
+
+def adaptive_adapter_prediction(fastq, ratios, kmer_lens,
+                                max_reads=ADAPTIVE_MAX_READS,
+                                batch_size=ADAPTIVE_BATCH,
+                                patience=ADAPTIVE_PATIENCE,
+                                tolerance=ADAPTIVE_TOLERANCE,
+                                sampling="head", seed=None):
+    """Return a Predictor fed with reads in FASTQ until the
+       prediction is stable or max_reads reads are counted.
+
+       See Predictor.feed_until_stable for the stopping rule. With
+       sampling other than 'head', a sample of max_reads reads is
+       drawn first and fed in a random order, since the samplers
+       return reads in file order. The early exit then saves
+       counting but not reading: reservoir sampling still reads
+       the whole file.
+    """
+    predictor = Predictor(kmer_lens, ratios)
+    if sampling != "head":
+        reads = list(sample_sequences(fastq, max_reads, sampling, seed))
+        random.Random(seed).shuffle(reads)
+        predictor.feed_until_stable(reads, batch_size, patience, tolerance)
+        return predictor
+    fq_obj = get_file_obj(fastq, binary=True)
+    predictor.feed_until_stable(fastq_sequence(fq_obj), batch_size,
+                                patience, tolerance, max_reads)
+    fq_obj.close()
+    return predictor
+
+
+class _TeeReader(object):
+    """Binary file object writing all the data read to out.
+
+    """
+
+    def __init__(self, fobj, out):
+        self.fobj = fobj
+        self.out = out
+
+    def read(self, size=-1):
+        data = self.fobj.read(size)
+        if data:
+            self.out.write(data)
+        return data
+
+
+def tee_prediction(fobj, out, predictor, report, sample_num=None,
+                   adaptive=None):
+    """Copy a binary FASTQ stream to out unchanged while feeding
+       its reads to a Predictor, and return the number of reads fed.
+
+       Reads are fed up to sample_num, or until the prediction is
+       stable if adaptive is a dictionary of feed_until_stable
+       parameters. report is called with the predictor as soon as
+       the prediction is made, and the rest of the stream is then
+       copied without parsing. The whole stream is copied even if
+       the prediction or report fails, and the error is raised
+       afterwards.
+    """
+    tee = _TeeReader(fobj, out)
+    try:
+        if adaptive is not None:
+            num = predictor.feed_until_stable(fastq_sequence(tee), **adaptive)
+        else:
+            num = predictor.feed(fastq_sequence(tee), sample_num)
+        report(predictor)
+    finally:
+        while True:
+            data = fobj.read(CHUNK_SIZE)
+            if not data:
+                break
+            out.write(data)
+        out.flush()
+    return num
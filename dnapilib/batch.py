@@ -0,0 +1,160 @@
+"""Functions for adapter prediction over many FASTQ files.
+
+"""
+
+import os.path
+import json
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dnapilib import io_utils
+from dnapilib import kmer
+from dnapilib import stats
+from dnapilib.apred import adapter_prediction
+from dnapilib.apred import iterative_adapter_prediction
+from dnapilib.apred import adaptive_adapter_prediction
+
+
+def sample_name(fastq):
+    """Return a sample name from a FASTQ file name.
+
+    """
+    return os.path.basename(fastq).split(".")[0]
+
+
+def unique_samples(samples):
+    """Return a list of (sample, FASTQ) with unique sample names.
+
+       A name shared by several FASTQs (e.g. a.fq and a.fq.gz) is
+       replaced by the FASTQ file names, numbered if a FASTQ is
+       given more than once.
+    """
+    names = Counter([s for s, fq in samples])
+    samples = [(fq, fq) if names[s] > 1 else (s, fq) for s, fq in samples]
+    names = Counter([s for s, fq in samples])
+    seen = Counter()
+    out = []
+    for s, fq in samples:
+        if names[s] > 1:
+            seen[s] += 1
+            s = "{}#{}".format(s, seen[s])
+        out.append((s, fq))
+    return out
+
+
+def read_manifest(manifest):
+    """Return a list of (sample, FASTQ) in a manifest file.
+
+       Each line has a FASTQ file name, or a sample name and a
+       FASTQ file name separated by a tab. Empty lines and lines
+       starting with '#' are ignored.
+    """
+    samples = []
+    for x in open(manifest):
+        x = x.strip()
+        if not x or x.startswith("#"):
+            continue
+        x = x.split("\t")
+        if len(x) == 1:
+            samples.append((sample_name(x[0]), x[0]))
+        elif len(x) == 2:
+            samples.append((x[0], x[1]))
+        else:
+            raise Exception("bad manifest line: {}".format("\t".join(x)))
+    return samples
+
+
+def _predict(job):
+    """Return (sample, FASTQ, predicted adapters, error message,
+       statistics).
+
+    """
+    sample, fastq, ratios, kmer_lens, sample_num, opts = job
+    io_utils.DECOMPRESS = opts["decompress"]
+    kmer.LOW_COMPLEXITY = opts["low_complexity"]
+    if opts["stats"]:
+        stats.enable()
+    else:
+        stats.disable()
+    adapts = error = None
+    try:
+        if opts["adaptive"]:
+            predictor = adaptive_adapter_prediction(
+                            fastq, ratios, kmer_lens,
+                            sampling=opts["sampling"], seed=opts["seed"],
+                            **opts["adaptive"])
+            adapts = predictor.predict()
+        elif len(kmer_lens) > 1 or len(ratios) > 1:
+            adapts = iterative_adapter_prediction(
+                         fastq, ratios, kmer_lens, sample_num,
+                         sampling=opts["sampling"], seed=opts["seed"],
+                         cache=opts["cache"], approx=opts["approx"])
+        else:
+            adapts = adapter_prediction(
+                         fastq, ratios[0], kmer_lens[0], sample_num,
+                         sampling=opts["sampling"], seed=opts["seed"],
+                         cache=opts["cache"], approx=opts["approx"])
+    except Exception as e:
+        error = str(e)
+    report = stats.STATS.report() if opts["stats"] else None
+    return sample, fastq, adapts, error, report
+
+
+def batch_prediction(samples, ratios, kmer_lens, sample_num, jobs=None,
+                     sampling="head", seed=None, adaptive=None, cache=None,
+                     approx=None, collect_stats=False):
+    """Return results of adapter prediction as each FASTQ finishes.
+
+       samples is a list of (sample, FASTQ). Each result is a
+       tuple of (sample, FASTQ, predicted adapters, error message,
+       statistics) in which either the adapters or the error is
+       None, and the statistics are the stats report of the FASTQ
+       if collect_stats is True, otherwise None. FASTQs
+       are processed by a pool of jobs processes. If adaptive is a
+       dictionary of adaptive_adapter_prediction parameters, reads
+       are counted until the prediction is stable instead of up to
+       sample_num. cache is a KmerCache shared by the processes,
+       and approx is a dictionary of SketchCounter parameters for
+       approximate counting.
+    """
+    opts = {"sampling": sampling, "seed": seed, "adaptive": adaptive,
+            "cache": cache, "approx": approx,
+            "decompress": io_utils.DECOMPRESS,
+            "low_complexity": kmer.LOW_COMPLEXITY,
+            "stats": collect_stats}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_predict, (s, fq, ratios, kmer_lens,
+                                          sample_num, opts))
+                   for s, fq in samples]
+        for f in as_completed(futures):
+            yield f.result()
+
+
+TSV_HEADER = "# sample\t3'adapter\tscore\tfastq\terror"
+
+
+def format_result(result, out_format="tsv", show_all=False):
+    """Return a formatted line(s) of a batch prediction result.
+
+       TSV lines have the columns of TSV_HEADER, and the error is
+       NA unless the prediction failed. A FASTQ without predicted
+       adapters gets a line of NA.
+    """
+    sample, fastq, adapts, error = result[:4]
+    if not show_all and adapts:
+        adapts = adapts[:1]
+    if out_format == "json":
+        out = {"sample": sample, "fastq": fastq}
+        if error:
+            out["error"] = error
+        else:
+            out["adapters"] = [{"seq": s, "score": round(c, 2)}
+                               for s, c in adapts]
+        return json.dumps(out)
+    if error:
+        return "{}\tNA\tNA\t{}\t{}".format(sample, fastq,
+                                           " ".join(error.split()) or "error")
+    if not adapts:
+        return "{}\tNA\tNA\t{}\tNA".format(sample, fastq)
+    return "\n".join(["{}\t{}\t{:.2f}\t{}\tNA".format(sample, s, c, fastq)
+                      for s, c in adapts])
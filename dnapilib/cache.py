@@ -0,0 +1,135 @@
+"""On-disk cache of k-mer frequency tables.
+
+"""
+
+import os
+import os.path
+import hashlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+CACHE_DIR = "~/.cache/dnapi"
+CACHE_SIZE = 1024 * 1024 * 1024
+
+
+class CachedCounter(object):
+    """K-mer frequency tables loaded from or stored to the cache,
+       with the same frequency() as KmerCounter.
+
+    """
+
+    def __init__(self, freqs, read_count):
+        self.kmer_lens = sorted(freqs)
+        self.read_count = read_count
+        self._freqs = freqs
+
+    def frequency(self, kmer_len):
+        """Return sorted k-mer frequency.
+
+        """
+        if kmer_len not in self._freqs:
+            raise Exception("{}-mers are not counted".format(kmer_len))
+        return self._freqs[kmer_len]
+
+
+class KmerCache(object):
+    """Store sorted k-mer frequency in .npz files keyed by a FASTQ
+       fingerprint (path, size, mtime), k and sampling parameters.
+
+       Each table is an array of k-mer byte strings and an array of
+       counts in the sorted order. Files are evicted in least
+       recently used order once the cache exceeds max_size bytes.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_size=CACHE_SIZE):
+        if np is None:
+            raise Exception("k-mer cache requires numpy")
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_size = max_size
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def key(self, fastq, kmer_len, sample_num, sampling="head", seed=None):
+        """Return a cache key, or None if FASTQ can't be cached.
+
+           Random samples without a seed are not cached, since
+           every run draws a different sample.
+        """
+        if fastq == "-" or not os.path.isfile(fastq):
+            return None
+        if sampling != "head" and seed is None:
+            return None
+        st = os.stat(fastq)
+        if sampling == "head":
+            seed = None
+        return "\t".join(map(str, [os.path.abspath(fastq), st.st_size,
+                                   st.st_mtime_ns, kmer_len, sample_num,
+                                   sampling, seed]))
+
+    def _path(self, key):
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name + ".npz")
+
+    def load(self, key):
+        """Return (sorted k-mer frequency, read count) of a key,
+           or None if the key is not cached.
+
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                if str(data["key"]) != key:
+                    return None
+                kmers = data["kmers"].astype(str).tolist()
+                counts = data["counts"].tolist()
+                read_count = int(data["read_count"])
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        os.utime(path, None)
+        return list(zip(kmers, counts)), read_count
+
+    def store(self, key, freq, read_count):
+        """Write sorted k-mer frequency of a key, and evict
+           old tables if the cache is too large.
+
+        """
+        path = self._path(key)
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        kmers = np.array([s.encode("latin-1") for s, n in freq],
+                         dtype="S{}".format(max([len(s) for s, n in freq]
+                                                or [1])))
+        counts = np.array([n for s, n in freq], dtype=np.int64)
+        with open(temp, "wb") as f:
+            np.savez(f, key=np.array(key), kmers=kmers, counts=counts,
+                     read_count=np.array(read_count))
+        os.replace(temp, path)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used tables until the cache
+           fits in max_size bytes.
+
+        """
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum([size for t, size, path in files])
+        for t, size, path in sorted(files):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,183 @@
+"""Collapse identical reads with counts within a memory budget.
+
+"""
+
+import os
+import sys
+import heapq
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+
+
+ENTRY_SIZE = 100
+PACK_LEN = 64
+MERGE_RUNS = 64
+_TO_DIGITS = str.maketrans("ACGT", "0123")
+_FROM_BYTE = ["".join(["ACGT"[(b >> s) & 3] for s in (6, 4, 2, 0)])
+              for b in range(256)]
+
+
+def pack_bases(seq):
+    """Return an integer of a read in 2 bits per base, or None if
+       the read has characters other than A, C, G and T.
+
+    """
+    if seq.strip("ACGT"):
+        return None
+    return int(seq.translate(_TO_DIGITS) or "0", 4)
+
+
+def unpack_bases(data):
+    """Return bases packed in 2 bits per base in bytes.
+
+    """
+    return "".join([_FROM_BYTE[b] for b in data])
+
+
+def pack_read(seq):
+    """Return an integer packing a read of A, C, G and T in 2 bits
+       per base, left-aligned to PACK_LEN bases so that integers
+       sort in the order of reads, with the length in the lowest
+       byte. Reads with other characters or longer than PACK_LEN
+       are returned as they are.
+
+    """
+    if len(seq) > PACK_LEN:
+        return seq
+    val = pack_bases(seq)
+    if val is None:
+        return seq
+    return (val << (2*(PACK_LEN-len(seq)) + 8)) | len(seq)
+
+
+def unpack_read(key):
+    """Return the read packed by pack_read.
+
+    """
+    if isinstance(key, str):
+        return key
+    return unpack_bases((key >> 8).to_bytes(PACK_LEN // 4, "big"))[:key & 255]
+
+
+def _read_run(path):
+    with open(path) as f:
+        for line in f:
+            seq, cnt = line.rstrip("\n").split("\t")
+            yield seq, int(cnt)
+
+
+def _merge(iters):
+    for seq, group in groupby(heapq.merge(*iters), key=itemgetter(0)):
+        yield seq, sum([cnt for s, cnt in group])
+
+
+class ReadCollapser(object):
+    """Count identical reads in a dictionary, spilling its sorted
+       items to temporary files once the estimated size exceeds
+       max_memory bytes (None for no limit).
+
+       The spilled runs are merged by sequence in items(). If packed
+       is True, reads are kept as 2-bit packed integers (see
+       pack_read), which take less memory than strings.
+    """
+
+    def __init__(self, max_memory=None, temp_dir=None, packed=False):
+        self.max_memory = max_memory
+        self.temp_dir = temp_dir
+        self.packed = packed
+        self.read_count = 0
+        self.size = 0
+        self.runs = []
+        self._table = {}
+
+    def add(self, seq, cnt=1):
+        """Add cnt copies of a read.
+
+        """
+        self.update({seq: cnt})
+
+    def update(self, counts):
+        """Add reads in a dictionary of reads to counts.
+
+        """
+        table = self._table
+        size = 0
+        for seq, cnt in counts.items():
+            key = pack_read(seq) if self.packed else seq
+            n = table.get(key)
+            if n is None:
+                table[key] = cnt
+                size += sys.getsizeof(key) + ENTRY_SIZE
+            else:
+                table[key] = n + cnt
+            self.read_count += cnt
+        self.size += size
+        if self.max_memory is not None and self.size > self.max_memory:
+            self._spill()
+
+    def _sorted_table(self):
+        table = self._table
+        if not self.packed:
+            return ((k, table[k]) for k in sorted(table))
+        ints = sorted([k for k in table if not isinstance(k, str)])
+        strs = sorted([k for k in table if isinstance(k, str)])
+        return heapq.merge(((unpack_read(k), table[k]) for k in ints),
+                           ((k, table[k]) for k in strs))
+
+    def _write_run(self, items):
+        fd, path = tempfile.mkstemp(prefix="dnapi_collapse_", suffix=".txt",
+                                    dir=self.temp_dir)
+        with os.fdopen(fd, "w") as f:
+            buf = []
+            for seq, cnt in items:
+                buf.append("{}\t{}\n".format(seq, cnt))
+                if len(buf) == 10000:
+                    f.write("".join(buf))
+                    buf = []
+            f.write("".join(buf))
+        self.runs.append(path)
+
+    def _spill(self):
+        if self._table:
+            self._write_run(self._sorted_table())
+        self._table = {}
+        self.size = 0
+        while len(self.runs) > MERGE_RUNS:
+            runs, self.runs = self.runs[:MERGE_RUNS], self.runs[MERGE_RUNS:]
+            self._write_run(_merge([_read_run(p) for p in runs]))
+            for path in runs:
+                os.remove(path)
+
+    def items(self, sort=False):
+        """Return (read, count) of the distinct reads, sorted by the
+           reads if sort is True or if any runs were spilled, and in
+           the order of their first appearance otherwise.
+
+        """
+        if not self.runs:
+            if sort:
+                return self._sorted_table()
+            if self.packed:
+                return ((unpack_read(k), n) for k, n in self._table.items())
+            return iter(self._table.items())
+        self._spill()
+        return self._merge_runs()
+
+    def _merge_runs(self):
+        try:
+            for item in _merge([_read_run(p) for p in self.runs]):
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Remove the spilled runs and discard all reads.
+
+        """
+        for path in self.runs:
+            if os.path.exists(path):
+                os.remove(path)
+        self.runs = []
+        self._table = {}
+        self.size = 0
@@ -4,13 +4,30 @@
 """
 
 import re
+import os
+import errno
+import signal
 import os.path
 import subprocess
-import fileinput
+import struct
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
+from dnapilib import stats
 from dnapilib.io_utils import get_file_obj
 from dnapilib.io_utils import fastq_sequence
+from dnapilib.io_utils import fastq_lines
+from dnapilib.io_utils import chunk_lines
 from dnapilib.io_utils import fastq_record
+from dnapilib.io_utils import bgzf_blocks
+from dnapilib.collapse import ReadCollapser
+from dnapilib.store import ReadStore
+from dnapilib.store import write_store
+
+
+COLLAPSE_MEMORY = None
+COLLAPSE_PACKED = False
 
 
 def rm_temp_dir(temp_dir):
@@ -41,29 +58,109 @@ def clip_adapter(fp, aseed, tm5, tm3, min_len, max_len):
             yield clipped_seq
 
 
-def to_fasta(fastq, fasta, aseed, tm5, tm3, min_len, max_len):
-    """Write FASTA containing clean reads, and return
+def clip_adapters(fp, aseeds, tm5, tm3, min_len, max_len, temp_dir=None):
+    """Return a dictionary of adapter seeds to ReadCollapsers of
+       clean reads, clipping all the seeds in a single scan of reads.
+
+       Identical reads in each block of FASTQ are collapsed first,
+       so every distinct read is clipped once per seed. Collapsed
+       reads beyond COLLAPSE_MEMORY bytes are spilled to temp_dir.
+    """
+    memory = COLLAPSE_MEMORY
+    if memory is not None:
+        memory //= max(len(aseeds), 1)
+    tables = dict((aseed, ReadCollapser(memory, temp_dir, COLLAPSE_PACKED))
+                  for aseed in aseeds)
+    raw = [t for a, t in tables.items() if "RAW_INPUT".startswith(a)]
+    clip = [(a.upper(), len(a), t) for a, t in tables.items()
+            if not "RAW_INPUT".startswith(a)]
+    for lines in fastq_lines(fp):
+        reads = Counter(lines[1::4])
+        for table in raw:
+            table.update(reads)
+        if not clip:
+            continue
+        block = [{} for x in clip]
+        for seq, cnt in reads.items():
+            if len(seq) < tm5 or len(seq) < tm3:
+                raise Exception("trimming length is too large")
+            useq = seq.upper()
+            for (aseed, seed_len, table), fas in zip(clip, block):
+                end = useq.rfind(aseed)
+                if end < 0:
+                    continue
+                clipped_seq = seq[tm5 : end-tm3]
+                L = len(clipped_seq)
+                if min_len <= L and L <= max_len:
+                    fas[clipped_seq] = fas.get(clipped_seq, 0) + cnt
+        for (aseed, seed_len, table), fas in zip(clip, block):
+            table.update(fas)
+    return tables
+
+
+def _write_fasta(fasta, fas):
+    """Write collapsed reads in FASTA, and return
        the number of the reads.
 
     """
-    fq_obj = get_file_obj(fastq)
-    if "RAW_INPUT".startswith(aseed):
-        iterator = fastq_sequence(fq_obj)
-    else:
-        iterator = clip_adapter(fq_obj, aseed, tm5, tm3, min_len, max_len)
-    fas = {}
     clean_read_count = 0
-    for seq in iterator:
-        fas[seq] = fas.get(seq, 0) + 1
     fa_obj = open(fasta, "w")
     for seq, cnt in fas.items():
         clean_read_count += cnt
         fa_obj.write(">{0}_{1}\n{0}\n".format(seq, cnt))
     fa_obj.close()
-    fq_obj.close()
     return clean_read_count
 
 
+def to_fasta(fastq, fasta, aseed, tm5, tm3, min_len, max_len):
+    """Write FASTA containing clean reads, and return
+       the number of the reads.
+
+    """
+    fq_obj = get_file_obj(fastq, binary=True)
+    fas = clip_adapters(fq_obj, [aseed], tm5, tm3, min_len, max_len,
+                        os.path.dirname(os.path.abspath(fasta)))
+    fq_obj.close()
+    return _write_fasta(fasta, fas[aseed])
+
+
+@stats.timed("clip_adapters")
+def multi_to_fasta(fastq, aseeds, tm5, tm3, min_len, max_len, temp_dir):
+    """Write FASTA containing clean reads for each adapter seed
+       in a single scan of FASTQ, and return a dictionary of the
+       seeds to the numbers of the reads.
+
+    """
+    fq_obj = get_file_obj(fastq, binary=True)
+    tables = clip_adapters(fq_obj, aseeds, tm5, tm3, min_len, max_len,
+                           temp_dir)
+    fq_obj.close()
+    counts = {}
+    for aseed, fas in tables.items():
+        fasta = "{0}/insert_{1}.fa".format(temp_dir, aseed)
+        counts[aseed] = _write_fasta(fasta, fas)
+    return counts
+
+
+@stats.timed("clip_adapters")
+def multi_to_store(fastq, aseeds, tm5, tm3, min_len, max_len, temp_dir):
+    """Write a store of clean reads (see dnapilib.store) for each
+       adapter seed in a single scan of FASTQ, and return a
+       dictionary of the seeds to the numbers of the reads.
+
+    """
+    fq_obj = get_file_obj(fastq, binary=True)
+    tables = clip_adapters(fq_obj, aseeds, tm5, tm3, min_len, max_len,
+                           temp_dir)
+    fq_obj.close()
+    counts = {}
+    for aseed, fas in tables.items():
+        path = "{0}/insert_{1}.reads".format(temp_dir, aseed)
+        counts[aseed] = write_store(path, fas.items())
+    return counts
+
+
+@stats.timed("input_prep")
 def fastq_input_prep(fastq, ratio, temp_dir):
     """Write FASTQ in the temporary directory, and retrun
        (subsampled) FASTQ name, the total read count,
@@ -74,7 +171,7 @@ def fastq_input_prep(fastq, ratio, temp_dir):
     read_count = 0.0
     stats = {}
     fq_out = "{}/input.fq".format(temp_dir)
-    fq_obj = get_file_obj(fastq)
+    fq_obj = get_file_obj(fastq, binary=True)
     fout = open(fq_out, "w")
     for i, rec in enumerate(fastq_record(fq_obj)):
         if i % num == 0:
@@ -90,40 +187,247 @@ def fastq_input_prep(fastq, ratio, temp_dir):
     return fq_out, read_count, sd
 
 
-def count_mapped_read_sam(samout):
+def _sam_mapped_names(fobj):
+    """Return read names with reference names in SAM.
+
+       Only QNAME and RNAME are split off each line.
+    """
+    for lines in chunk_lines(fobj):
+        for x in lines:
+            if not x or x.startswith("@"):
+                continue
+            x = x.split("\t", 3)
+            if x[2] != '*':
+                yield x[0]
+
+
+def _bam_mapped_names(fobj):
+    """Return read names with reference IDs in BAM.
+
+    """
+    buf = b""
+    pos = 0
+    header = True
+    for data in bgzf_blocks(fobj):
+        buf = buf[pos:] + data
+        pos = 0
+        if header:
+            if len(buf) < 12:
+                continue
+            if buf[:4] != b"BAM\1":
+                raise Exception("bad BAM header")
+            l_text = struct.unpack_from("<i", buf, 4)[0]
+            if len(buf) < 12 + l_text:
+                continue
+            n_ref = struct.unpack_from("<i", buf, 8 + l_text)[0]
+            p = 12 + l_text
+            for i in range(n_ref):
+                if len(buf) < p + 4:
+                    p = len(buf) + 1
+                    break
+                p += 8 + struct.unpack_from("<i", buf, p)[0]
+            if len(buf) < p:
+                continue
+            pos = p
+            header = False
+        while len(buf) - pos >= 4:
+            size = struct.unpack_from("<i", buf, pos)[0]
+            if len(buf) - pos < 4 + size:
+                break
+            ref_id, l_name = struct.unpack_from("<i4xB", buf, pos+4)
+            if ref_id >= 0:
+                yield buf[pos+36 : pos+35+l_name].decode("latin-1")
+            pos += 4 + size
+
+
+class _PrefixedStream(object):
+    """Binary stream reading bytes already read from fobj
+       before the rest of fobj.
+
+    """
+
+    def __init__(self, prefix, fobj):
+        self.prefix = prefix
+        self.fobj = fobj
+
+    def read(self, size=-1):
+        data, self.prefix = self.prefix, b""
+        if size is None or size < 0:
+            return data + self.fobj.read()
+        if len(data) > size:
+            data, self.prefix = data[:size], data[size:]
+        return data + self.fobj.read(size - len(data))
+
+
+def count_mapped_reads(fobj, counts=None):
+    """Return the number of mapped reads to the genome in a
+       binary stream of SAM or BAM.
+
+       Read counts are taken from the read names (SEQ_COUNT), or
+       from counts indexed by the read names if it is given, while
+       the stream is read, and each read is counted once.
+    """
+    head = fobj.read(4)
+    fobj = _PrefixedStream(head, fobj)
+    if head == b"\x1f\x8b\x08\x04":
+        names = _bam_mapped_names(fobj)
+    else:
+        names = _sam_mapped_names(fobj)
+    mapped = set()
+    cnt = 0
+    for n in names:
+        if n not in mapped:
+            mapped.add(n)
+            if counts is None:
+                cnt += int(n.split('_')[1])
+            else:
+                cnt += counts[int(n)]
+    return cnt
+
+
+def count_mapped_read_sam(samout, counts=None):
     """Return the number of mapped reads to the genome.
 
     """
     if not os.path.exists(samout):
         raise Exception("can't open SAM")
-    mapped = set()
-    for x in fileinput.input(samout):
-        if not x or x.startswith("@"):
+    with open(samout, "rb") as fobj:
+        return count_mapped_reads(fobj, counts)
+
+
+def _unblock_fifo(proc, fifo, opened, unblocked):
+    """Wait for a mapping command, and open the FIFO for writing
+       until the reader has opened it, in case the command never
+       opened it. unblocked is set if the reader was released so.
+
+    """
+    proc.wait()
+    while not opened.is_set():
+        try:
+            fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+            opened.wait(0.01)
             continue
-        x = x.rstrip().split("\t")
-        if x[2] != '*':
-            mapped.add(x[0])
-    cnt = sum([int(n.split('_')[1]) for n in mapped])
-    return cnt
+        unblocked.set()
+        os.close(fd)
+        return
 
 
-def map_clean_reads(fastq, adapter, tm5, tm3,
-                    min_len, max_len, map_command, temp_dir):
-    """Execute mapping command, and return the numbers
-       of clean and mapped reads.
+def _kill_group(proc):
+    """Kill a command started in its own session with all the
+       processes of its group.
 
     """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def map_reads(adapter, map_command, temp_dir, stream=False):
+    """Execute mapping command on the clean reads of an adapter,
+       and return the number of mapped reads.
+
+       If the reads are in a store, they are exported to FASTA
+       named by their indices only while the command runs, and
+       mapped reads are counted by the indices. If stream is True,
+       @out is a FIFO and mapped reads are counted while the
+       command runs, so no SAM is written.
+    """
     fasta = "{0}/insert_{1}.fa".format(temp_dir, adapter)
-    samout = "{}/output.sam".format(temp_dir)
-    clipped = to_fasta(fastq, fasta, adapter, tm5, tm3, min_len, max_len)
+    path = "{0}/insert_{1}.reads".format(temp_dir, adapter)
+    if not os.path.isdir(path):
+        return _map_fasta(fasta, adapter, map_command, temp_dir, stream)
+    with ReadStore(path) as store:
+        store.export_fasta(fasta)
+        try:
+            return _map_fasta(fasta, adapter, map_command, temp_dir,
+                              stream, store.count)
+        finally:
+            os.remove(fasta)
+
+
+def _map_fasta(fasta, adapter, map_command, temp_dir, stream, counts=None):
+    samout = "{0}/output_{1}.sam".format(temp_dir, adapter)
     map_command = map_command.replace("@in",fasta).replace("@out",samout)
     map_command += " 2> /dev/null"
-    if subprocess.call(map_command, shell=True) != 0:
+    if not stream:
+        if subprocess.call(map_command, shell=True) != 0:
+            raise Exception("mapping failed, check command line")
+        return count_mapped_read_sam(samout, counts)
+
+    if os.path.lexists(samout):
+        os.remove(samout)
+    os.mkfifo(samout)
+    proc = subprocess.Popen(map_command, shell=True, start_new_session=True)
+    opened = threading.Event()
+    unblocked = threading.Event()
+    waiter = threading.Thread(target=_unblock_fifo,
+                              args=(proc, samout, opened, unblocked))
+    waiter.start()
+    try:
+        try:
+            fobj = open(samout, "rb")
+        finally:
+            opened.set()
+        with fobj:
+            head = fobj.read(4)
+            if not head:
+                waiter.join()
+                if proc.returncode != 0:
+                    raise Exception("mapping failed, check command line")
+                if unblocked.is_set():
+                    raise Exception("can't open SAM")
+            mapped = count_mapped_reads(_PrefixedStream(head, fobj), counts)
+    except Exception:
+        _kill_group(proc)
+        raise
+    finally:
+        waiter.join()
+        os.remove(samout)
+    if proc.returncode != 0:
         raise Exception("mapping failed, check command line")
-    mapped = count_mapped_read_sam(samout)
+    return mapped
+
+
+def map_clean_reads(fastq, adapter, tm5, tm3,
+                    min_len, max_len, map_command, temp_dir):
+    """Execute mapping command, and return the numbers
+       of clean and mapped reads.
+
+    """
+    clipped = multi_to_store(fastq, [adapter], tm5, tm3,
+                             min_len, max_len, temp_dir)[adapter]
+    mapped = map_reads(adapter, map_command, temp_dir)
     return clipped, mapped
 
 
+@stats.timed("map_reads")
+def map_candidates(fastq, adapters, tm5, tm3, min_len, max_len,
+                   map_command, temp_dir, jobs=None, stream=False):
+    """Execute mapping commands for adapter candidates concurrently,
+       and return a dictionary of the adapters to the numbers of
+       clean and mapped reads.
+
+       Reads are clipped for all candidates in a single scan of
+       FASTQ. Each candidate has its own store of clean reads and
+       SAM, and at most jobs candidates (default: the number of
+       CPUs) are mapped at the same time.
+    """
+    adapters = sorted(set(adapters))
+    clipped = multi_to_store(fastq, adapters, tm5, tm3,
+                             min_len, max_len, temp_dir)
+    if not jobs:
+        jobs = min(len(adapters), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(map_reads, a, map_command, temp_dir, stream)
+                   for a in adapters]
+        return dict((a, (clipped[a], f.result()))
+                    for a, f in zip(adapters, futures))
+
+
 def make_stats_report(table, sampled_read, subsample_rate, prefix_match,
                       sd, fastq, output_dir, temp_dir, no_output_files):
     """Report read statistics with predicted adapters.
@@ -164,7 +468,12 @@ def make_stats_report(table, sampled_read, subsample_rate, prefix_match,
             aseq = optimal[0][:prefix_match]
             fa_tmp = "{}/insert_{}.fa".format(temp_dir, aseq)
             fa_out = "{}/{}_{}.fa".format(output_dir, fq_prefix, aseq)
-            subprocess.call(("mv {} {}".format(fa_tmp,fa_out)).split())
+            store = "{}/insert_{}.reads".format(temp_dir, aseq)
+            if os.path.isdir(store):
+                with ReadStore(store) as st:
+                    st.export_fasta(fa_out, ids=False)
+            else:
+                subprocess.call(("mv {} {}".format(fa_tmp,fa_out)).split())
 
     out.insert(0, "optimal_3'adapter={}\n".format(''.join(optimal)))
     report = "\n".join(out)
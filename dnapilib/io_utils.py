@@ -3,64 +3,421 @@
 """
 
 import io
+import re
+import sys
 import bz2
+import zlib
 import gzip
+import lzma
+import shutil
+import struct
 import zipfile
 import tarfile
 import os.path
-import fileinput
+import threading
+import subprocess
+from itertools import islice
 
+from dnapilib import stats
 
-def get_file_obj(in_file):
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CHUNK_SIZE = 8 * 1024 * 1024
+CHUNK_LINES = 4 * 100000
+_TRAILING_SPACE = re.compile(r"[ \t\r\f\v]+\n")
+
+DECOMPRESS = "auto"
+DECOMPRESS_MODES = ("auto", "thread", "python")
+DECOMPRESS_QUEUE = 4
+BGZF_MAX_BLOCK = 65536
+DECOMPRESS_TOOLS = {
+    ".gz":  (["pigz", "-dc"], ["igzip", "-dc"]),
+    ".bz2": (["pbzip2", "-dc"], ["lbzip2", "-dc"]),
+    ".zst": (["zstd", "-dc"],),
+    ".xz":  (["xz", "-dc", "-T0"],),
+}
+
+
+class _PipeStream(io.RawIOBase):
+    """Binary stream reading the output of a decompression command.
+
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.proc = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL)
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.proc.stdout.readinto(b)
+        if not n:
+            self.eof = True
+            if self.proc.wait() != 0:
+                raise Exception("failed: {}".format(" ".join(self.command)))
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.proc.stdout.close()
+            if not self.eof:
+                self.proc.kill()
+            self.proc.wait()
+        super(_PipeStream, self).close()
+
+
+class _ThreadStream(io.RawIOBase):
+    """Binary stream decompressed by a background thread.
+
+       Compression modules release the GIL, so decompression
+       overlaps with parsing in the main thread.
+    """
+
+    def __init__(self, fobj, chunk_size=CHUNK_SIZE):
+        self.fobj = fobj
+        self.chunk_size = chunk_size
+        self.queue = []
+        self.cond = threading.Condition()
+        self.stop = False
+        self.done = False
+        self.error = None
+        self.buf = memoryview(b"")
+        self.thread = threading.Thread(target=self._fill)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _fill(self):
+        while True:
+            try:
+                data = self.fobj.read(self.chunk_size)
+            except Exception as e:
+                data = e
+            with self.cond:
+                while len(self.queue) >= DECOMPRESS_QUEUE and not self.stop:
+                    self.cond.wait()
+                if self.stop:
+                    return
+                self.queue.append(data)
+                self.cond.notify_all()
+            if not data or isinstance(data, Exception):
+                return
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.error is not None:
+            raise self.error
+        if not self.buf and not self.done:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                data = self.queue.pop(0)
+                self.cond.notify_all()
+            if isinstance(data, Exception):
+                self.done = True
+                self.error = data
+                raise data
+            self.done = not data
+            self.buf = memoryview(data)
+        n = min(len(b), len(self.buf))
+        b[:n] = self.buf[:n]
+        self.buf = self.buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            with self.cond:
+                self.stop = True
+                self.cond.notify_all()
+            self.thread.join()
+            self.fobj.close()
+        super(_ThreadStream, self).close()
+
+
+def _compression(in_file):
+    """Return the compression suffix of an input file.
+
+    """
+    for ext in (".gz", ".bz2", ".zst", ".xz"):
+        if in_file.endswith(ext):
+            return ext
+    if in_file.endswith(".bz"):
+        return ".bz2"
+    return None
+
+
+def _open_compressed(in_file, ext):
+    """Return a binary object decompressed by a Python module.
+
+    """
+    if ext == ".gz":
+        return gzip.open(in_file, "rb")
+    elif ext == ".bz2":
+        return bz2.open(in_file, "rb")
+    elif ext == ".xz":
+        return lzma.open(in_file, "rb")
+    elif zstandard is not None:
+        dctx = zstandard.ZstdDecompressor()
+        return dctx.stream_reader(open(in_file, "rb"), closefd=True)
+    raise Exception("can't decompress {}: install zstd or "
+                    "zstandard".format(in_file))
+
+
+def _open_binary(in_file, decompress):
+    """Return a binary file object from an input file.
+
+    """
+    if in_file == "-":
+        return sys.stdin.buffer
+    if in_file.find(".tar") > 0:
+        tp = tarfile.open(in_file, "r:*")
+        for member in tp:
+            if member.isfile():
+                return tp.extractfile(member)
+        raise Exception("no file in {}".format(in_file))
+    if in_file.endswith(".zip"):
+        zobj = zipfile.ZipFile(in_file)
+        return zobj.open(zobj.namelist()[0], "r")
+
+    ext = _compression(in_file)
+    if not ext:
+        return open(in_file, "rb")
+    if decompress not in DECOMPRESS_MODES:
+        raise Exception("bad decompression mode: {}".format(decompress))
+    commands = [c for c in DECOMPRESS_TOOLS[ext] if shutil.which(c[0])]
+    no_module = ext == ".zst" and zstandard is None
+    if commands and (decompress == "auto" or no_module):
+        raw = _PipeStream(commands[0] + [in_file])
+        return io.BufferedReader(raw, CHUNK_SIZE)
+    fobj = _open_compressed(in_file, ext)
+    if decompress == "python":
+        return fobj
+    return io.BufferedReader(_ThreadStream(fobj), CHUNK_SIZE)
+
+
+def get_file_obj(in_file, binary=False, decompress=None):
     """Return a file object from an input file.
 
+       A binary object is returned if binary is True, which
+       is the fast path for the FASTQ parsers below. Compressed
+       files are decompressed by a parallel command (pigz, igzip,
+       pbzip2, lbzip2, zstd or xz) if available, otherwise by a
+       background thread; decompress="python" keeps it in the
+       calling thread. The default mode is DECOMPRESS. If
+       statistics are enabled, the time waiting for input is
+       recorded as the stage 'read_input'.
     """
     if not os.path.exists(in_file) and in_file != "-":
         raise Exception("can't open {}".format(in_file))
+    fobj = stats.timed_input(_open_binary(in_file, decompress or DECOMPRESS))
+    if binary:
+        return fobj
+    return io.TextIOWrapper(fobj)
+
+
+def get_out_obj(out_file):
+    """Return a binary file object to write an output file,
+       compressed by the file suffix (.gz, .bz2 or .xz).
+
+    """
+    if out_file == "-":
+        return sys.stdout.buffer
+    ext = _compression(out_file)
+    if ext == ".gz":
+        return gzip.open(out_file, "wb", compresslevel=6)
+    elif ext == ".bz2":
+        return bz2.open(out_file, "wb")
+    elif ext == ".xz":
+        return lzma.open(out_file, "wb")
+    return io.BufferedWriter(open(out_file, "wb", buffering=0), CHUNK_SIZE)
 
-    if in_file.find(".tar") > 0:
-        if in_file.endswith(".tar.gz"):
-            tp = tarfile.open(in_file, "r:gz")
-        elif in_file.endswith(".tar"):
-            tp = tarfile.open(in_file, "r")
-        elif in_file.endswith(".tar.bz2"):
-            tp = tarfile.open(in_file, "r:bz2")
-        return io.TextIOWrapper(tp)
-    elif in_file.endswith(".gz"):
-        return gzip.open(in_file, "rt")
-    elif in_file.endswith(".zip"):
-        zobj = zipfile.ZipFile(in_file)
-        zp = zobj.open(zobj.namelist()[0], "r")
-        return io.TextIOWrapper(zp)
-    elif in_file.endswith(".bz") or in_file.endswith(".bz2"):
-        return bz2.BZ2File(in_file, "rt")
-    else:
-        return fileinput.input(in_file)
+
+def _strip_lines(data):
+    """Remove trailing whitespace of all lines in a text block.
+
+    """
+    if "\r" in data or " \n" in data or "\t\n" in data:
+        return _TRAILING_SPACE.sub("\n", data)
+    return data
+
+
+def text_chunks(fobj, chunk_size=CHUNK_SIZE, record_lines=1):
+    """Return text blocks of whole records of record_lines lines.
+
+       Large chunks are read at once and cut after the last
+       complete record found by counting newlines. Trailing
+       whitespace of the lines is removed once per chunk. Line
+       iterators without read() are consumed in line blocks.
+    """
+    read = getattr(fobj, "read", None)
+    if read is None:
+        while True:
+            lines = list(islice(fobj, CHUNK_LINES))
+            if not lines:
+                return
+            data = "".join(lines)
+            if not data.endswith("\n"):
+                data += "\n"
+            yield _strip_lines(data)
+
+    rest = ""
+    while True:
+        data = read(chunk_size)
+        if not data:
+            break
+        if isinstance(data, bytes):
+            data = data.decode("latin-1")
+        data = rest + data
+        n = data.count("\n")
+        if n < record_lines:
+            rest = data
+            continue
+        cut = len(data)
+        for _ in range(n%record_lines + 1):
+            cut = data.rfind("\n", 0, cut)
+        yield _strip_lines(data[:cut+1])
+        rest = data[cut+1:]
+    if rest:
+        yield _strip_lines(rest if rest.endswith("\n") else rest + "\n")
+
+
+def chunk_lines(fobj, chunk_size=CHUNK_SIZE, record_lines=1):
+    """Return lists of lines in blocks of whole records of
+       record_lines lines.
+
+       Lines are strings without trailing whitespace split off
+       each chunk at once, so consumers need not strip them.
+    """
+    for chunk in text_chunks(fobj, chunk_size, record_lines):
+        lines = chunk.split("\n")
+        lines.pop()
+        yield lines
+
+
+def fastq_chunks(fobj, chunk_size=CHUNK_SIZE):
+    """Return text blocks of whole FASTQ records.
+
+    """
+    return text_chunks(fobj, chunk_size, 4)
+
+
+def fastq_lines(fobj, chunk_size=CHUNK_SIZE):
+    """Return lists of lines in blocks of FASTQ records.
+
+    """
+    return chunk_lines(fobj, chunk_size, 4)
 
 
 def fastq_sequence(fobj):
     """Return sequence lines in FASTQ.
 
     """
-    for i, x in enumerate(fobj):
-        if i % 4 == 1: yield x.rstrip()
+    for lines in fastq_lines(fobj):
+        for x in lines[1::4]:
+            yield x
 
 
 def fastq_quality(fobj):
     """Return quality score lines in FASTQ.
 
     """
-    for i, x in enumerate(fobj):
-        if i % 4 == 3: yield x.rstrip()
+    for lines in fastq_lines(fobj):
+        for x in lines[3::4]:
+            yield x
 
 
 def fastq_record(fobj):
     """Return sets of read records in FASTQ.
 
     """
-    record = ""
-    for i, x in enumerate(fobj):
-        record += x
-        if i % 4 == 3:
-            yield record
-            record = ""
+    for lines in fastq_lines(fobj):
+        it = iter(lines)
+        for rec in zip(it, it, it, it):
+            yield "\n".join(rec) + "\n"
+
+
+def is_bgzf(in_file):
+    """Return True if an input file is BGZF compressed.
+
+    """
+    if in_file == "-" or not in_file.endswith(".gz"):
+        return False
+    with open(in_file, "rb") as f:
+        head = f.read(18)
+    return (len(head) == 18 and head[:4] == b"\x1f\x8b\x08\x04"
+            and head[12:14] == b"BC")
+
+
+def _bgzf_block(fobj, offset):
+    """Return the next BGZF block at or after a byte offset as
+       (block_start, block_size, decompressed data), or None.
+
+       Candidate headers are validated by decompressing the
+       block and checking its uncompressed size.
+    """
+    magic = b"\x1f\x8b\x08\x04"
+    fobj.seek(offset)
+    data = fobj.read(2 * BGZF_MAX_BLOCK)
+    p = data.find(magic)
+    while p >= 0:
+        if len(data) - p < BGZF_MAX_BLOCK and p > 0:
+            offset += p
+            fobj.seek(offset)
+            data = fobj.read(2 * BGZF_MAX_BLOCK)
+            p = 0
+        if len(data) - p < 18:
+            return None
+        xlen = struct.unpack("<H", data[p+10:p+12])[0]
+        if data[p+12:p+14] == b"BC" and xlen >= 6:
+            size = struct.unpack("<H", data[p+16:p+18])[0] + 1
+            block = data[p:p+size]
+            try:
+                out = zlib.decompress(block[12+xlen:-8], -15)
+            except zlib.error:
+                out = None
+            if (out is not None and len(block) == size and
+                    len(out) == struct.unpack("<I", block[-4:])[0]):
+                return offset + p, size, out
+        p = data.find(magic, p+1)
+    return None
+
+
+def bgzf_blocks(fobj, offset=None):
+    """Return decompressed data of consecutive BGZF blocks.
+
+       Blocks are read from the current position of fobj, which
+       can be a pipe, or from the first block at or after a
+       compressed byte offset if it is given.
+    """
+    if offset is not None:
+        block = _bgzf_block(fobj, offset)
+        if not block:
+            return
+        start, size, data = block
+        fobj.seek(start + size)
+        if data:
+            yield data
+    while True:
+        head = fobj.read(18)
+        if not head:
+            return
+        if len(head) < 18:
+            raise Exception("truncated BGZF block")
+        if head[:4] != b"\x1f\x8b\x08\x04" or head[12:14] != b"BC":
+            raise Exception("bad BGZF block")
+        xlen = struct.unpack("<H", head[10:12])[0]
+        size = struct.unpack("<H", head[16:18])[0] + 1
+        rest = fobj.read(size - 18)
+        if len(rest) < size - 18:
+            raise Exception("truncated BGZF block")
+        data = zlib.decompress(rest[xlen-6:-8], -15)
+        if data:
+            yield data
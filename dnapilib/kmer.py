@@ -4,8 +4,30 @@
 
 import sys
 import re
+import math
+import random
+from itertools import islice
 from operator import itemgetter
 
+from dnapilib import stats
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+PACKED_MAX_KMER = 31
+PACKED_BATCH_SIZE = 100000
+DENSE_MAX_KMER = 11
+FILTER_BLOCK = 1024
+LOW_COMPLEXITY = ("homopolymer",)
+COMPLEXITY_MEASURES = ("homopolymer", "dinucleotide", "dust")
+DUST_THRESHOLD = 1.0
+SKETCH_WIDTH = 2**20
+SKETCH_DEPTH = 4
+SKETCH_CAPACITY = 20000
+
 
 def _calc_overlap(x, y, seed):
     """Return an overlapping position between a pair of k-mers.
@@ -26,34 +48,205 @@ def _calc_overlap(x, y, seed):
     return 0
 
 
-def filter_kmers(kmers, kmer_len, rate):
-    """Return a clean set of k-mers in tuple.
+def _low_complexity_naive(kmers, kmer_len, measures):
+    """Return a list of flags of low-complexity k-mers.
+
+    """
+    run_len = kmer_len // 2
+    flags = []
+    for s in kmers:
+        low = False
+        if "homopolymer" in measures:
+            run = 0
+            for j, b in enumerate(s):
+                run = run + 1 if j and b == s[j-1] else 1
+                if b in "ACGTN" and run >= run_len:
+                    low = True
+                    break
+        if not low and "dinucleotide" in measures:
+            rep = 2
+            for j in range(2, len(s)):
+                rep = rep + 1 if s[j] == s[j-2] else 2
+                if (s[j] in "ACGT" and s[j] != s[j-1]
+                        and rep >= run_len + 2):
+                    low = True
+                    break
+        if not low and "dust" in measures:
+            triplets = [s[j : j+3] for j in range(len(s)-2)]
+            pairs = sum([triplets[i] == triplets[j]
+                         for i in range(len(triplets))
+                         for j in range(i+1, len(triplets))])
+            low = pairs > DUST_THRESHOLD * max(len(triplets)-1, 1)
+        flags.append(low)
+    return flags
+
 
-       Filter low-complexity and low-frequency kmers.
+def low_complexity(kmers, kmer_len, measures=None):
+    """Return flags of low-complexity k-mers.
+
+       'homopolymer' flags runs of a base (ACGTN) as long as half
+       of k, 'dinucleotide' flags two-base repeats two bases longer
+       than that, and 'dust' flags k-mers whose DUST score (pairs
+       of identical triplets per triplet) is over DUST_THRESHOLD.
+       With NumPy, all k-mers are classified column by column on
+       a byte matrix.
     """
-    low_comp = [re.compile(base * (kmer_len//2)) for base in "ACGTN"]
-    i, x = -1, -1
-    while x != len(low_comp):
-        i += 1
-        x = sum([not p.findall(kmers[i][0]) for p in low_comp])
-    max_hits = kmers[i][1]
+    if measures is None:
+        measures = LOW_COMPLEXITY
+    for m in measures:
+        if m not in COMPLEXITY_MEASURES:
+            raise Exception("bad complexity measure: {}".format(m))
+    if np is None or not len(kmers):
+        return _low_complexity_naive(kmers, kmer_len, measures)
+    width = max(map(len, kmers))
+    arr = np.array([s.encode("latin-1") for s in kmers],
+                   dtype="S{}".format(width)).view(np.uint8)
+    arr = arr.reshape(len(kmers), width)
+    run_len = kmer_len // 2
+    low = np.zeros(len(kmers), dtype=bool)
+    if "homopolymer" in measures:
+        hp = np.zeros(256, dtype=bool)
+        hp[np.frombuffer(b"ACGTN", dtype=np.uint8)] = True
+        run = np.ones(len(kmers), dtype=np.int64)
+        low |= hp[arr[:, 0]] & (run >= run_len)
+        for j in range(1, width):
+            same = arr[:, j] == arr[:, j-1]
+            run = np.where(same, run + 1, 1)
+            low |= hp[arr[:, j]] & (run >= run_len)
+    if "dinucleotide" in measures:
+        acgt = np.zeros(256, dtype=bool)
+        acgt[np.frombuffer(b"ACGT", dtype=np.uint8)] = True
+        rep = np.full(len(kmers), 2, dtype=np.int64)
+        for j in range(2, width):
+            rep = np.where(arr[:, j] == arr[:, j-2], rep + 1, 2)
+            low |= (acgt[arr[:, j]] & (arr[:, j] != arr[:, j-1])
+                    & (rep >= run_len + 2))
+    if "dust" in measures and width > 2:
+        codes = arr.astype(np.int64)
+        triplets = codes[:, :-2] * 65536 + codes[:, 1:-1] * 256 + codes[:, 2:]
+        pairs = np.zeros(len(kmers), dtype=np.int64)
+        for d in range(1, width-2):
+            pairs += (triplets[:, d:] == triplets[:, :-d]).sum(axis=1)
+        low |= pairs > DUST_THRESHOLD * max(width-3, 1)
+    return low
+
+
+@stats.timed("filter_kmers")
+def filter_kmers(kmers, kmer_len, rate, measures=None):
+    """Return a clean set of k-mers in tuple.
 
+       Filter low-complexity and low-frequency kmers. K-mers are
+       classified by low_complexity in growing blocks from the most
+       frequent one, since only the ones within rate of the most
+       frequent clean k-mer are used.
+    """
+    max_hits = None
     clean = []
     total = 0
-    for s, n in kmers[i:]:
-        if sum([not p.findall(s) for p in low_comp]) != len(low_comp):
-            continue
-        if float(max_hits)/n > rate:
-            break
-        clean.append((s, n))
-        total += n
+    beg, size = 0, FILTER_BLOCK
+    while beg < len(kmers):
+        block = kmers[beg : beg+size]
+        flags = low_complexity([s for s, n in block], kmer_len, measures)
+        for (s, n), low in zip(block, flags):
+            if low:
+                continue
+            if max_hits is None:
+                max_hits = n
+            if float(max_hits)/n > rate:
+                beg = len(kmers)
+                break
+            clean.append((s, n))
+            total += n
+        beg += size
+        size *= 2
     return [(s, round(float(n)/total*100, 4)) for s, n in clean]
 
 
-def assemble_kmers(kmers, seed):
-    """Return assembled k-mers and the frequency in tuple.
+def _find_overlap(x, y, seed):
+    """Return an overlapping position between a pair of k-mers.
+
+       Same as _calc_overlap, but with plain string search for
+       sequences without regular expression metacharacters.
+    """
+    if not x or not y:
+        return 0
+    pat = y[:seed]
+    beg = x.find(pat)
+    while beg >= 0:
+        p = beg + len(pat)
+        if len(x) == p:
+            return seed
+        if y.find(x[p:]) == seed:
+            return seed + len(x) - p
+        beg = x.find(pat, p)
+    return 0
+
+
+class _OverlapIndex(object):
+    """Hash index of live k-mers by sequence and by seed prefix.
+
+    """
+
+    def __init__(self, kmers, seed):
+        self.kmers = kmers
+        self.seed = seed
+        self.by_seq = {}
+        self.by_prefix = {}
+        self.seq_lens = {}
+        self.prefix_lens = {}
+        for j in range(len(kmers)):
+            self.add(j)
+
+    @staticmethod
+    def _put(table, lens, key, j):
+        table.setdefault(key, set()).add(j)
+        lens[len(key)] = lens.get(len(key), 0) + 1
+
+    @staticmethod
+    def _pop(table, lens, key, j):
+        table[key].discard(j)
+        lens[len(key)] -= 1
+        if not lens[len(key)]:
+            del lens[len(key)]
+
+    def add(self, j):
+        s = self.kmers[j][0]
+        if s:
+            self._put(self.by_seq, self.seq_lens, s, j)
+            self._put(self.by_prefix, self.prefix_lens, s[:self.seed], j)
+
+    def remove(self, j):
+        s = self.kmers[j][0]
+        if s:
+            self._pop(self.by_seq, self.seq_lens, s, j)
+            self._pop(self.by_prefix, self.prefix_lens, s[:self.seed], j)
+
+    @staticmethod
+    def _lookup(table, lens, x, i):
+        found = set()
+        for n in lens:
+            for p in range(len(x)-n+1):
+                found.update(table.get(x[p:p+n], ()))
+        found.discard(i)
+        return sorted(found)
+
+    def contained(self, x, i):
+        """Return indices of k-mers found in x except i.
+
+        """
+        return self._lookup(self.by_seq, self.seq_lens, x, i)
+
+    def candidates(self, x, i):
+        """Return indices of k-mers whose seed prefixes
+           are found in x except i.
+
+        """
+        return self._lookup(self.by_prefix, self.prefix_lens, x, i)
+
+
+def _assemble_naive(kmers, seed):
+    """Return assembled k-mers by comparing all pairs.
 
-       Assemble given k-mers by checking suffix-prefix matches.
     """
     pre_l, new_l = 0, len(kmers)
     while pre_l != new_l:
@@ -84,16 +277,410 @@ def assemble_kmers(kmers, seed):
     return kmers
 
 
+@stats.timed("assemble_kmers")
+def assemble_kmers(kmers, seed):
+    """Return assembled k-mers and the frequency in tuple.
+
+       Assemble given k-mers by checking suffix-prefix matches.
+       Contained k-mers and overlap candidates of each contig are
+       looked up in a hash index of sequences and seed prefixes
+       instead of comparing all pairs.
+    """
+    plain = re.compile("[A-Za-z]*$")
+    if seed < 1 or not all(plain.match(s) for s, n in kmers):
+        return _assemble_naive(kmers, seed)
+
+    pre_l, new_l = 0, len(kmers)
+    while pre_l != new_l:
+        pre_l = len(kmers)
+        index = _OverlapIndex(kmers, seed)
+        for i in range(pre_l):
+            kmer, hits = kmers[i]
+            if not hits:
+                continue
+            for j in index.contained(kmer, i):
+                hits += kmers[j][1]
+                index.remove(j)
+                kmers[j] = ('', 0)
+            kmers[i] = (kmer, hits)
+            max_o, max_j = 0, 0
+            for j in index.candidates(kmer, i):
+                overlap = _find_overlap(kmer, kmers[j][0], seed)
+                if overlap > max_o:
+                    max_o, max_j = overlap, j
+            if max_o > 0:
+                index.remove(i)
+                index.remove(max_j)
+                kmer += kmers[max_j][0][max_o:]
+                hits += kmers[max_j][1]
+                kmers[i] = (kmer, hits)
+                kmers[max_j] = ('', 0)
+                index.add(i)
+        kmers = [k for k in kmers if k != ('', 0)]
+        new_l = len(kmers)
+    return kmers
+
+
 def count_kmers(seq_list, kmer_len, sample_num):
     """Return sorted k-mer frequency.
 
+       The 2-bit packed engine is used when NumPy is available.
+    """
+    counter = KmerCounter([kmer_len])
+    counter.update(seq_list, sample_num)
+    return counter.frequency(kmer_len)
+
+
+def count_kmers_packed(seq_list, kmer_len, sample_num,
+                       batch_size=PACKED_BATCH_SIZE):
+    """Return sorted k-mer frequency counted as 2-bit packed
+       integers over batches of reads.
+
+    """
+    counter = KmerCounter([kmer_len], batch_size, packed=True)
+    counter.update(seq_list, sample_num)
+    return counter.frequency(kmer_len)
+
+
+def _base_codes():
+    """Return a lookup table from ASCII to 2-bit base codes.
+
+       Bases other than ACGT are coded as 4 and read
+       separators (newlines) as 5.
+    """
+    table = np.full(256, 4, dtype=np.uint8)
+    for i, b in enumerate(b"ACGT"):
+        table[b] = i
+    table[ord("\n")] = 5
+    return table
+
+
+def _merge_counts(keys, counts, firsts):
+    """Return unique keys with summed counts and
+       the first positions where the keys appeared.
+
+    """
+    if not len(keys):
+        return keys, counts, firsts
+    order = np.argsort(keys)
+    keys, counts, firsts = keys[order], counts[order], firsts[order]
+    starts = np.flatnonzero(
+        np.concatenate(([True], keys[1:] != keys[:-1])))
+    return (keys[starts], np.add.reduceat(counts, starts),
+            np.minimum.reduceat(firsts, starts))
+
+
+def pack_kmers(codes, kmer_lens):
+    """Return 2-bit packed codes of all k-mer windows in a
+       base code array, and masks of the windows only with ACGT
+       and the windows with other bases in a read, for each k.
+
+       Codes of all k are taken from a single rolling pass of
+       the longest k; window i of every k starts at codes[i].
+    """
+    kmer_lens = sorted(set(kmer_lens))
+    max_len = kmer_lens[-1]
+    n = len(codes)
+    dtype = np.uint32 if max_len <= 16 else np.uint64
+    pad = np.full(max_len-1, 5, dtype=np.uint8)
+    codes = np.concatenate((codes, pad))
+    bits = (codes & 3).astype(dtype)
+    stop = np.zeros(len(codes)+1, dtype=np.int64)
+    np.cumsum(codes > 3, out=stop[1:])
+    if (codes == 4).any():
+        sep = np.zeros(len(codes)+1, dtype=np.int64)
+        np.cumsum(codes == 5, out=sep[1:])
+    else:
+        sep = None
+
+    windows = {}
+    packed = bits[:n].copy()
+    for j in range(1, max_len+1):
+        if j > 1:
+            packed <<= dtype(2)
+            packed |= bits[j-1:j-1+n]
+        if j not in kmer_lens:
+            continue
+        ok = stop[j:j+n] == stop[:n]
+        if sep is None:
+            odd = np.zeros(n, dtype=bool)
+        else:
+            odd = ~ok & (sep[j:j+n] == sep[:n])
+        windows[j] = (packed.copy(), ok, odd)
+    return windows
+
+
+def unpack_kmers(packed, kmer_len):
+    """Return k-mer strings from 2-bit packed codes.
+
+    """
+    shifts = np.arange(2*(kmer_len-1), -1, -2, dtype=np.uint64)
+    idx = (packed.astype(np.uint64)[:, None] >> shifts) & np.uint64(3)
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)[idx]
+    bases = np.ascontiguousarray(bases, dtype=np.uint8)
+    return bases.view("S{}".format(kmer_len)).ravel().astype(str)
+
+
+class KmerCounter(object):
+    """Tally k-mers of several lengths in a single pass over reads.
+
+       With NumPy, k-mers are counted as 2-bit packed integers
+       over batches of reads: short k-mers are tallied in a dense
+       table and longer ones are merged by sorting. K-mers with
+       bases other than ACGT are counted as byte strings. Ties are
+       kept in the order of first occurrence, so frequencies are
+       identical to the ones from the dictionary counting.
+    """
+
+    def __init__(self, kmer_lens, batch_size=PACKED_BATCH_SIZE,
+                 packed=None):
+        self.kmer_lens = sorted(set(kmer_lens))
+        if not self.kmer_lens or self.kmer_lens[0] <= 0:
+            raise Exception("bad k-mer length")
+        fits = self.kmer_lens[-1] <= PACKED_MAX_KMER
+        if packed is None:
+            packed = np is not None and fits
+        elif packed and (np is None or not fits):
+            raise Exception("packed k-mer counting requires numpy and "
+                            "k-mers up to {}".format(PACKED_MAX_KMER))
+        self.packed = packed
+        self.batch_size = batch_size
+        self.read_count = 0
+        self._offset = 0
+        self._tables = {}
+        for k in self.kmer_lens:
+            self._tables[k] = self._new_table(k)
+
+    def _new_table(self, kmer_len):
+        if not self.packed:
+            return {}
+        e64 = np.zeros(0, dtype=np.int64)
+        other = (np.zeros(0, dtype="S{}".format(kmer_len)), e64, e64)
+        if kmer_len <= DENSE_MAX_KMER:
+            acgt = (np.zeros(4**kmer_len, dtype=np.int64),
+                    np.full(4**kmer_len, np.iinfo(np.int64).max))
+        else:
+            acgt = (np.zeros(0, dtype=np.uint64), e64, e64)
+        return [acgt, other]
+
+    @stats.timed("count_kmers", reads=True)
+    def update(self, seq_list, sample_num=None):
+        """Count k-mers in reads up to sample_num, and return
+           the number of the reads counted.
+
+        """
+        seq_iter = islice(iter(seq_list), sample_num)
+        if not self.packed:
+            return self._update_dict(seq_iter)
+        num = 0
+        while True:
+            batch = list(islice(seq_iter, self.batch_size))
+            if not batch:
+                break
+            self._update_packed(batch)
+            num += len(batch)
+        return num
+
+    def _update_dict(self, seq_iter):
+        num = 0
+        for seq in seq_iter:
+            for k, freq in self._tables.items():
+                for i in range(len(seq) - k + 1):
+                    kmer = seq[i : i+k]
+                    freq[kmer] = freq.get(kmer, 0) + 1
+            num += 1
+        self.read_count += num
+        return num
+
+    def _update_packed(self, batch):
+        buf = np.frombuffer(
+            "\n".join(batch).encode("ascii", "replace"), dtype=np.uint8)
+        win = np.lib.stride_tricks.sliding_window_view
+        pos = np.arange(self._offset, self._offset+len(buf), dtype=np.int64)
+        windows = pack_kmers(_base_codes()[buf], self.kmer_lens)
+        for k, (packed, ok, odd) in windows.items():
+            acgt, other = self._tables[k]
+            if k <= DENSE_MAX_KMER:
+                idx = packed[ok].astype(np.intp)
+                acgt[0][:] += np.bincount(idx, minlength=len(acgt[0]))
+                np.minimum.at(acgt[1], idx, pos[ok])
+            else:
+                self._tables[k][0] = _merge_counts(
+                    np.concatenate((acgt[0], packed[ok])),
+                    np.concatenate((acgt[1], np.ones(ok.sum(), np.int64))),
+                    np.concatenate((acgt[2], pos[ok])))
+            if odd.any():
+                keys = np.ascontiguousarray(win(buf, k)[odd[:len(buf)-k+1]])
+                keys = keys.view("S{}".format(k)).ravel()
+                self._tables[k][1] = _merge_counts(
+                    np.concatenate((other[0], keys)),
+                    np.concatenate((other[1], np.ones(len(keys), np.int64))),
+                    np.concatenate((other[2], pos[odd])))
+        self._offset += len(buf) + 1
+        self.read_count += len(batch)
+
+    @stats.timed("sort_kmers")
+    def frequency(self, kmer_len):
+        """Return sorted k-mer frequency.
+
+        """
+        if kmer_len not in self._tables:
+            raise Exception("{}-mers are not counted".format(kmer_len))
+        if not self.packed:
+            freq = self._tables[kmer_len]
+            return sorted(freq.items(), key=itemgetter(1), reverse=True)
+        acgt, other = self._tables[kmer_len]
+        if kmer_len <= DENSE_MAX_KMER:
+            seen = np.flatnonzero(acgt[0])
+            acgt = (seen.astype(np.uint64), acgt[0][seen], acgt[1][seen])
+        kmers = np.concatenate((unpack_kmers(acgt[0], kmer_len),
+                                other[0].astype(str)))
+        counts = np.concatenate((acgt[1], other[1]))
+        firsts = np.concatenate((acgt[2], other[2]))
+        order = np.lexsort((firsts, -counts))
+        return list(zip(kmers[order].tolist(), counts[order].tolist()))
+
+
+class SketchCounter(object):
+    """Tally k-mers approximately in fixed memory.
+
+       Each k has a count-min sketch of depth rows of width
+       counters, and a set of up to capacity heavy-hitter k-mers
+       with the largest estimated counts. Only the heavy hitters
+       are reported by frequency(), which is enough for
+       filter_kmers as long as capacity covers the k-mers within
+       the filtering ratio of the most frequent one. K-mers with
+       bases other than ACGT are not counted. Estimates never
+       undercount, and overcount by at most error_bound() with
+       probability 1 - exp(-depth).
+    """
+
+    def __init__(self, kmer_lens, width=SKETCH_WIDTH, depth=SKETCH_DEPTH,
+                 capacity=SKETCH_CAPACITY, batch_size=PACKED_BATCH_SIZE):
+        self.kmer_lens = sorted(set(kmer_lens))
+        if not self.kmer_lens or self.kmer_lens[0] <= 0:
+            raise Exception("bad k-mer length")
+        if np is None or self.kmer_lens[-1] > PACKED_MAX_KMER:
+            raise Exception("approximate k-mer counting requires numpy "
+                            "and k-mers up to {}".format(PACKED_MAX_KMER))
+        if width <= 0 or depth <= 0 or capacity <= 0:
+            raise Exception("bad sketch size")
+        self.bits = max(1, int(math.ceil(math.log(width, 2))))
+        self.width = 2**self.bits
+        self.depth = depth
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.read_count = 0
+        self._offset = 0
+        rng = random.Random(0)
+        self._hashes = [(np.uint64(rng.getrandbits(64) | 1),
+                         np.uint64(rng.getrandbits(64)))
+                        for _ in range(depth)]
+        self._totals = dict((k, 0) for k in self.kmer_lens)
+        self._sketches = {}
+        self._heavy = {}
+        e64 = np.zeros(0, dtype=np.int64)
+        for k in self.kmer_lens:
+            self._sketches[k] = np.zeros((depth, self.width), dtype=np.int64)
+            self._heavy[k] = (np.zeros(0, dtype=np.uint64), e64, e64)
+
+    def _rows(self, keys):
+        shift = np.uint64(64 - self.bits)
+        for a, b in self._hashes:
+            yield ((keys * a + b) >> shift).astype(np.intp)
+
+    def estimate(self, kmer_len, keys):
+        """Return estimated counts of 2-bit packed k-mers.
+
+        """
+        sketch = self._sketches[kmer_len]
+        keys = np.asarray(keys, dtype=np.uint64)
+        est = None
+        for i, idx in enumerate(self._rows(keys)):
+            row = sketch[i][idx]
+            est = row if est is None else np.minimum(est, row)
+        return est
+
+    @stats.timed("count_kmers", reads=True)
+    def update(self, seq_list, sample_num=None):
+        """Count k-mers in reads up to sample_num, and return
+           the number of the reads counted.
+
+        """
+        seq_iter = islice(iter(seq_list), sample_num)
+        num = 0
+        while True:
+            batch = list(islice(seq_iter, self.batch_size))
+            if not batch:
+                break
+            self._update_batch(batch)
+            num += len(batch)
+        return num
+
+    def _update_batch(self, batch):
+        buf = np.frombuffer(
+            "\n".join(batch).encode("ascii", "replace"), dtype=np.uint8)
+        windows = pack_kmers(_base_codes()[buf], self.kmer_lens)
+        for k, (packed, ok, odd) in windows.items():
+            pos = np.flatnonzero(ok)
+            keys, first, counts = np.unique(packed[ok].astype(np.uint64),
+                                            return_index=True,
+                                            return_counts=True)
+            sketch = self._sketches[k]
+            for i, idx in enumerate(self._rows(keys)):
+                sketch[i] += np.bincount(idx, weights=counts,
+                                         minlength=self.width).astype(np.int64)
+            self._totals[k] += int(counts.sum())
+
+            heavy, est, firsts = self._heavy[k]
+            keys = np.concatenate((heavy, keys))
+            firsts = np.concatenate((firsts, pos[first] + self._offset))
+            order = np.lexsort((firsts, keys))
+            keys, firsts = keys[order], firsts[order]
+            starts = np.flatnonzero(
+                np.concatenate(([True], keys[1:] != keys[:-1])))
+            keys, firsts = keys[starts], firsts[starts]
+            est = self.estimate(k, keys)
+            if len(keys) > self.capacity:
+                top = np.argpartition(-est, self.capacity-1)[:self.capacity]
+                keys, est, firsts = keys[top], est[top], firsts[top]
+            self._heavy[k] = (keys, est, firsts)
+        self._offset += len(buf) + 1
+        self.read_count += len(batch)
+
+    def error_bound(self, kmer_len):
+        """Return the maximum overcount of an estimate, which holds
+           with probability 1 - exp(-depth).
+
+        """
+        return math.e / self.width * self._totals[kmer_len]
+
+    @stats.timed("sort_kmers")
+    def frequency(self, kmer_len):
+        """Return the heavy-hitter k-mers sorted by
+           estimated frequency.
+
+        """
+        if kmer_len not in self._heavy:
+            raise Exception("{}-mers are not counted".format(kmer_len))
+        keys, est, firsts = self._heavy[kmer_len]
+        order = np.lexsort((firsts, -est))
+        kmers = unpack_kmers(keys[order], kmer_len)
+        return list(zip(kmers.tolist(), est[order].tolist()))
+
+
+def compare_frequency(approx, exact, top=100):
+    """Return a dictionary comparing approximate k-mer frequency
+       with exact frequency of the top k-mers: how many of them
+       were found (recall), and the maximum absolute and relative
+       errors of their counts.
+
     """
-    freq = {}
-    for cnt, seq in enumerate(seq_list):
-        if cnt == sample_num:
-            break
-        interval = len(seq) - kmer_len + 1
-        for i in range(interval):
-            kmer = seq[i : i+kmer_len]
-            freq[kmer] = freq.get(kmer, 0) + 1
-    return sorted(freq.items(), key=itemgetter(1), reverse=True)
+    found = dict(approx)
+    exact = exact[:top]
+    errors = [(found[s] - n, float(found[s] - n) / n)
+              for s, n in exact if s in found]
+    return {"top": len(exact),
+            "recall": float(len(errors)) / max(len(exact), 1),
+            "max_error": max([e for e, r in errors] or [0]),
+            "max_relative_error": max([r for e, r in errors] or [0.0])}
@@ -0,0 +1,110 @@
+"""Single-pass preprocessing of FASTQ.
+
+   Stages are chained as operators over blocks of FASTQ lines read
+   once from a single stream: quality encoding detection and
+   quality trimming (dnapilib.quality), adapter prediction on a
+   buffered prefix of the reads, and adapter clipping and output
+   (dnapilib.trim) of all the reads once the adapter is known.
+"""
+
+from itertools import chain
+
+from dnapilib import stats
+from dnapilib.io_utils import fastq_lines
+from dnapilib.quality import peek_qual_offset
+from dnapilib.quality import platform_phred
+from dnapilib.quality import illumina_33
+from dnapilib.quality import phred_table
+from dnapilib.quality import quality_trim
+from dnapilib.trim import AdapterMatcher
+from dnapilib.trim import clip_reads
+from dnapilib.trim import write_reads
+
+
+def predict_prefix(blocks, predictor, sample_num=None, adaptive=None):
+    """Feed reads from the first blocks to a Predictor, and return
+       blocks yielding all the blocks again.
+
+       Reads are fed up to sample_num, or until the prediction is
+       stable if adaptive is a dictionary of feed_until_stable
+       parameters. Blocks read for the prediction are kept in
+       memory until they are passed on.
+    """
+    blocks = iter(blocks)
+    seen = []
+
+    def sequences():
+        for lines in blocks:
+            seen.append(lines)
+            for seq in lines[1::4]:
+                yield seq
+
+    with stats.stage("predict_adapter"):
+        if adaptive is not None:
+            predictor.feed_until_stable(sequences(), **adaptive)
+        else:
+            predictor.feed(sequences(), sample_num)
+    return chain(seen, blocks)
+
+
+def _count_reads(blocks, counts):
+    for lines in blocks:
+        counts["reads"] += len(lines) // 4
+        yield lines
+
+
+def qc_pipeline(fobj, out, predictor=None, adapter=None, prefix_match=7,
+                mismatches=0, qual_cutoff=0, qual_base="auto", tm5=0, tm3=0,
+                min_len=0, max_len=None, keep_untrimmed=False,
+                out_format="fastq", sample_num=None, adaptive=None,
+                report=None, collapser=None):
+    """Quality-trim reads of a binary FASTQ stream, predict the 3'
+       adapter from the first reads, and write all the reads with
+       the adapter trimmed to out, reading the stream once.
+
+       Quality trimming is skipped if qual_cutoff is 0, and the
+       quality offset is guessed from the first reads if qual_base
+       is 'auto'. The adapter is predicted with predictor unless it
+       is given. report is called with a dictionary of the adapter
+       and the quality encoding before the reads are written, and
+       collapser is passed to write_reads.
+       Return a dictionary of the adapter, the quality encoding and
+       the numbers of input, trimmed and written reads.
+    """
+    result = {"adapter": adapter, "encoding": None, "reads": 0,
+              "trimmed": 0, "written": 0}
+    blocks = _count_reads(fastq_lines(fobj), result)
+    if qual_cutoff:
+        func = illumina_33
+        if qual_base == "auto":
+            name, qual_base, blocks = peek_qual_offset(blocks)
+            func = platform_phred(name)
+            result["encoding"] = name
+        table = phred_table(qual_base, func)
+        blocks = quality_trim(blocks, table, qual_cutoff, 1)
+
+    if adapter is None:
+        if predictor is None:
+            raise Exception("no adapter or predictor given")
+        blocks = predict_prefix(blocks, predictor, sample_num, adaptive)
+        adapts = predictor.predict()
+        if not adapts:
+            raise Exception("no reads to predict adapters")
+        adapter = adapts[0][0]
+        result["adapter"] = adapter
+    if len(adapter) < prefix_match:
+        raise Exception("3'adapter is too short (<{}): '{}'".format(
+                            prefix_match, adapter))
+    if report is not None:
+        report(result)
+
+    matcher = AdapterMatcher(adapter[:prefix_match], mismatches)
+    counts = {}
+    with stats.stage("trim_reads") as st:
+        write_reads(clip_reads(blocks, matcher, tm5, tm3, min_len, max_len,
+                               keep_untrimmed, counts),
+                    out, out_format, collapser)
+        st.add(reads=counts["reads"])
+    result["trimmed"] = counts["trimmed"]
+    result["written"] = counts["written"]
+    return result
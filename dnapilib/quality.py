@@ -0,0 +1,233 @@
+"""Functions to guess quality score encodings of FASTQ.
+
+"""
+
+import math
+from itertools import chain
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from dnapilib.io_utils import get_file_obj
+from dnapilib.io_utils import fastq_lines
+
+
+# (name, lowest and highest ASCII codes, offset) in the checked order
+PLATFORMS = [("Sanger/Illumina-1.8+", 33,  76, 33),
+             ("Illumina-1.5+", 67, 104, 64),
+             ("Illumina-1.3+", 54, 104, 64),
+             ("Solexa", 59, 104, 64)]
+QUAL_SAMPLE = 50000
+QUAL_CHUNK = 256 * 1024
+
+
+def solexa_to_phred(x):
+    return int(round(10 * math.log10(1+10**(x/10.0))))
+
+
+def illumina_64B(x):
+    if x == 2:
+        return 0
+    else:
+        return x
+
+
+def illumina_33(x):
+    return x
+
+
+def platform_phred(name):
+    """Return a function converting quality scores of a platform
+       to Phred quality.
+
+    """
+    if name == "Solexa":
+        return solexa_to_phred
+    elif name == "Illumina-1.5+":
+        return illumina_64B
+    return illumina_33
+
+
+class QualityEncoding(object):
+    """Histogram of quality characters to guess the encoding.
+
+       The range of the characters is taken from the second lowest
+       to the second highest one, so that a single outlier doesn't
+       affect the guess. The guess is the first platform whose
+       range covers it. As reads are added, the range only grows,
+       so the guess is settled once no other platform can replace
+       the first one.
+    """
+
+    def __init__(self, platforms=PLATFORMS):
+        self.platforms = platforms
+        self.hist = [0] * 256
+        self.read_count = 0
+
+    def update(self, quals):
+        """Add quality strings, and return True if the guess
+           is settled.
+
+        """
+        data = "".join(quals).encode("latin-1")
+        if np is not None:
+            counts = np.bincount(np.frombuffer(data, dtype=np.uint8),
+                                 minlength=256).tolist()
+            self.hist = [a + b for a, b in zip(self.hist, counts)]
+        else:
+            for c, n in Counter(data).items():
+                self.hist[c] += n
+        self.read_count += len(quals)
+        return self.settled()
+
+    def candidates(self):
+        """Return platforms covering the observed range, or None
+           if less than two characters are observed.
+
+        """
+        q_int = [c for c in range(256) if self.hist[c]]
+        if len(q_int) <= 1:
+            return None
+        return [pl for pl in self.platforms
+                if pl[1] <= q_int[1] and q_int[-2] <= pl[2]]
+
+    def settled(self):
+        """Return True if more reads can't change the guess except
+           to an unknown encoding.
+
+        """
+        pls = self.candidates()
+        if pls is None:
+            return False
+        if not pls:
+            return True
+        first = pls[0]
+        return all([first[1] <= pl[1] and pl[2] <= first[2]
+                    for pl in pls[1:]])
+
+    def guess(self):
+        """Return (platform name, offset) of the guess.
+
+        """
+        pls = self.candidates()
+        if not pls:
+            raise Exception("unknown quality encoding")
+        return pls[0][0], pls[0][3]
+
+
+def guess_qual_offset(fastq, sample_num=QUAL_SAMPLE):
+    """Return (platform name, offset) of quality scores guessed
+       from up to sample_num reads in FASTQ, stopping as soon as
+       the guess is settled.
+
+    """
+    enc = QualityEncoding()
+    fobj = get_file_obj(fastq, binary=True)
+    for lines in fastq_lines(fobj, QUAL_CHUNK):
+        quals = lines[3:sample_num*4:4]
+        sample_num -= len(quals)
+        if enc.update(quals) or sample_num <= 0:
+            break
+    fobj.close()
+    return enc.guess()
+
+
+def peek_qual_offset(blocks, sample_num=QUAL_SAMPLE):
+    """Guess the encoding from the first blocks of FASTQ lines, and
+       return (platform name, offset, blocks) where blocks yields
+       all the blocks again, so that reads are parsed only once.
+
+    """
+    enc = QualityEncoding()
+    seen = []
+    for lines in blocks:
+        seen.append(lines)
+        quals = lines[3:sample_num*4:4]
+        sample_num -= len(quals)
+        if enc.update(quals) or sample_num <= 0:
+            break
+    name, offset = enc.guess()
+    return name, offset, chain(seen, blocks)
+
+
+def phred_table(base, func):
+    """Return Phred quality scores of all 256 ASCII codes.
+
+    """
+    return [func(c - base) for c in range(256)]
+
+
+def trim_points(quals, table, cutoff):
+    """Return BWA trimming points of quality strings.
+
+    """
+    points = []
+    for qual in quals:
+        s, max_s = 0, 0
+        max_i = len(qual)
+        for i in reversed(range(max_i)):
+            s += cutoff - table[ord(qual[i])]
+            if s < 0:
+                break
+            if s > max_s:
+                max_s, max_i = s, i
+        points.append(max_i)
+    return points
+
+
+def trim_points_np(quals, table, cutoff):
+    """Return BWA trimming points of quality strings at once.
+
+       Scores (cutoff - Phred) of each read are laid out from the
+       3' end in a row of a zero-padded matrix, so that row-wise
+       cumulative sums are the running sums of the BWA loop. Each
+       read is trimmed at the first largest positive sum before
+       the first negative one.
+    """
+    if not quals:
+        return []
+    lens = np.array([len(q) for q in quals], dtype=np.int64)
+    width = max(int(lens.max()), 1)
+    codes = np.frombuffer("".join(quals).encode("latin-1"), dtype=np.uint8)
+    scores = cutoff - np.asarray(table, dtype=np.int32)[codes]
+    if len(codes) == width * len(lens):
+        mat = np.ascontiguousarray(scores.reshape(-1, width)[:, ::-1])
+    else:
+        rows = np.repeat(np.arange(len(lens)), lens)
+        cols = np.repeat(np.cumsum(lens) - 1, lens) - np.arange(len(codes))
+        mat = np.zeros((len(lens), width), dtype=np.int32)
+        mat[rows, cols] = scores
+    sums = np.cumsum(mat, axis=1, out=mat)
+    neg = sums < 0
+    stop = np.where(neg.any(axis=1), neg.argmax(axis=1), width)
+    sums[np.arange(width) >= stop[:, None]] = 0
+    best = sums.argmax(axis=1)
+    top = sums[np.arange(len(lens)), best]
+    return np.where(top > 0, lens - 1 - best, lens).tolist()
+
+
+def quality_trim(blocks, table, cutoff, min_len=1):
+    """Return blocks of FASTQ lines with low quality 3' ends trimmed
+       as in BWA from blocks of FASTQ lines.
+
+       Trimmed reads shorter than min_len or consisting of Ns only
+       are dropped. Lines are stripped in the output blocks.
+    """
+    find_points = trim_points if np is None else trim_points_np
+    for lines in blocks:
+        n = len(lines) // 4 * 4
+        names, seqs = lines[0:n:4], lines[1:n:4]
+        plus, quals = lines[2:n:4], lines[3:n:4]
+        points = find_points(quals, table, cutoff)
+        out = []
+        for i, max_i in enumerate(points):
+            if len(quals[i]) < min_len or max_i < min_len:
+                continue
+            seq = seqs[i][:max_i]
+            if len(seq) >= min_len and seq.upper().count("N") < len(seq):
+                out += [names[i], seq, plus[i],
+                        quals[i][:max_i]]
+        yield out
@@ -0,0 +1,161 @@
+"""Functions to sample reads from FASTQ.
+
+"""
+
+import math
+import random
+import os.path
+
+from dnapilib import stats
+from dnapilib.io_utils import get_file_obj
+from dnapilib.io_utils import fastq_lines
+from dnapilib.io_utils import is_bgzf
+from dnapilib.io_utils import bgzf_blocks
+
+
+SAMPLING_MODES = ("head", "reservoir", "seek")
+SEEK_WINDOW = 64 * 1024
+SEEK_READS = 64
+
+
+def reservoir_sample(fobj, sample_num, seed=None):
+    """Return sequences uniformly sampled from the whole FASTQ
+       in the input order.
+
+       Skips between replaced reads are drawn as in Algorithm L
+       and counted over blocks of lines, so reads that are not
+       sampled never reach Python code.
+    """
+    if sample_num <= 0:
+        return []
+    rng = random.Random(seed)
+    skip = lambda w: int(math.log(1.0-rng.random()) / math.log(1.0-w))
+    shrink = lambda: math.exp(math.log(1.0-rng.random()) / sample_num)
+    reservoir = []
+    w, nxt = 1.0, None
+    beg = 0
+    for lines in fastq_lines(fobj):
+        end = beg + len(lines)//4
+        i = beg
+        while len(reservoir) < sample_num and i < end:
+            reservoir.append((i, lines[4*(i-beg)+1]))
+            i += 1
+        if nxt is None and len(reservoir) == sample_num:
+            w *= shrink()
+            nxt = sample_num + skip(w)
+        while nxt is not None and nxt < end:
+            seq = lines[4*(nxt-beg)+1]
+            reservoir[rng.randrange(sample_num)] = (nxt, seq)
+            w *= shrink()
+            nxt += skip(w) + 1
+        beg = end
+    return [s for i, s in sorted(reservoir)]
+
+
+def _resync(text):
+    """Return lines of whole FASTQ records in a text block
+       starting from an arbitrary position.
+
+       The first line is skipped since it can be partial.
+    """
+    lines = text.split("\n")
+    lines.pop()
+    for i in range(1, len(lines)-3):
+        if (lines[i].startswith("@") and lines[i+2].startswith("+")
+                and len(lines[i+1]) == len(lines[i+3])):
+            lines = lines[i:]
+            return lines[:len(lines) - len(lines)%4]
+    return []
+
+
+def _read_window(fobj, offset, bgzf):
+    """Return a decoded text block from a byte offset, and
+       the number of compressed bytes read.
+
+    """
+    if not bgzf:
+        fobj.seek(offset)
+        data = fobj.read(SEEK_WINDOW)
+        return data.decode("latin-1"), len(data)
+    data = []
+    size = 0
+    for block in bgzf_blocks(fobj, offset):
+        data.append(block)
+        size += len(block)
+        if size >= SEEK_WINDOW:
+            break
+    return b"".join(data).decode("latin-1"), fobj.tell() - offset
+
+
+def _reservoir_file(fastq, sample_num, seed):
+    fq_obj = get_file_obj(fastq, binary=True)
+    sampled = reservoir_sample(fq_obj, sample_num, seed)
+    fq_obj.close()
+    return sampled
+
+
+def seek_sample(fastq, sample_num, seed=None, reads_per_seek=SEEK_READS):
+    """Return sequences sampled at random byte offsets.
+
+       Works on uncompressed and BGZF files: each random offset
+       is resynchronized on the next FASTQ record, and a run of
+       reads is taken from there. Other inputs, and files with
+       not many more reads than sample_num, are sampled with
+       reservoir sampling.
+    """
+    ext = os.path.splitext(fastq)[1]
+    bgzf = is_bgzf(fastq)
+    if (fastq == "-" or sample_num <= 0 or not bgzf and ext in
+            (".gz", ".bz", ".bz2", ".zip", ".xz", ".zst", ".tar")):
+        return _reservoir_file(fastq, sample_num, seed)
+
+    size = os.path.getsize(fastq)
+    fobj = open(fastq, "rb")
+    text, used = _read_window(fobj, 0, bgzf)
+    head = _resync("\n" + text)
+    est_reads = size / float(max(used, 1)) * len(head) / 4
+    if est_reads <= 4 * sample_num:
+        fobj.close()
+        return _reservoir_file(fastq, sample_num, seed)
+
+    rng = random.Random(seed)
+    sampled = []
+    seeks = int(math.ceil(sample_num / float(reads_per_seek)))
+    while len(sampled) < sample_num:
+        found = len(sampled)
+        for offset in sorted(rng.randrange(size) for _ in range(seeks)):
+            lines = _resync(_read_window(fobj, offset, bgzf)[0])
+            seqs = [x.rstrip() for x in lines[1::4][:reads_per_seek]]
+            sampled.extend(seqs[:sample_num-len(sampled)])
+            if len(sampled) == sample_num:
+                break
+        if found == len(sampled):
+            break
+    fobj.close()
+    return sampled
+
+
+@stats.timed("sample_reads")
+def sample_sequences(fastq, sample_num, sampling="head", seed=None):
+    """Return an iterable of sampled sequences in FASTQ.
+
+       'head' takes the first reads, 'reservoir' samples reads
+       uniformly from the whole file, and 'seek' samples reads at
+       random offsets of uncompressed or BGZF files.
+    """
+    if sampling not in SAMPLING_MODES:
+        raise Exception("bad sampling mode: {}".format(sampling))
+    if sampling == "seek":
+        return seek_sample(fastq, sample_num, seed)
+    fq_obj = get_file_obj(fastq, binary=True)
+    if sampling == "reservoir":
+        sampled = reservoir_sample(fq_obj, sample_num, seed)
+    else:
+        sampled = []
+        for lines in fastq_lines(fq_obj):
+            sampled.extend(lines[1::4])
+            if len(sampled) >= sample_num:
+                break
+        del sampled[sample_num:]
+    fq_obj.close()
+    return sampled
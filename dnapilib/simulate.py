@@ -0,0 +1,186 @@
+"""Functions to simulate small RNA sequencing reads.
+
+"""
+
+import io
+import bz2
+import math
+import gzip
+import lzma
+import zlib
+import random
+import struct
+import shutil
+import subprocess
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+ADAPTER = "TGGAATTCTCGGGTGCCAAGGAACTCCAGTCACATCTCGTATGCCGTCTTCTGCTTG"
+COMPRESSIONS = (None, "gz", "bgzf", "bz2", "xz", "zst")
+BGZF_BLOCK = 65280
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff060042430200"
+                         "1b0003000000000000000000")
+
+
+def _insert_pool(rng, size, min_len, max_len, mean_len, sd_len):
+    """Return distinct insert sequences with Zipf-like weights,
+       as small RNA libraries are dominated by a few abundant RNAs.
+
+    """
+    pool = set()
+    while len(pool) < size:
+        L = int(round(rng.gauss(mean_len, sd_len)))
+        L = min(max(L, min_len), max_len)
+        pool.add("".join([rng.choice("ACGT") for _ in range(L)]))
+    pool = sorted(pool)
+    rng.shuffle(pool)
+    weights = [1.0 / (i+1) for i in range(len(pool))]
+    return pool, weights
+
+
+def simulate_reads(read_num, adapter=ADAPTER, read_len=50, insert_mean=22,
+                   insert_sd=3, min_insert=15, max_insert=40, pool_size=2000,
+                   error_rate=0.001, polya_rate=0.0, low_comp_rate=0.0,
+                   seed=0):
+    """Return (name, sequence, quality) of simulated reads.
+
+       Each read is an insert followed by the 3' adapter, cut at
+       read_len. Inserts are drawn from a pool of pool_size RNAs
+       whose lengths are normally distributed. polya_rate of reads
+       get a poly-A tail before the adapter, and low_comp_rate of
+       reads are dinucleotide repeats without adapters. Bases are
+       substituted at error_rate, with low quality scores. Reads
+       are the same for the same seed.
+    """
+    rng = random.Random(seed)
+    pool, weights = _insert_pool(rng, pool_size, min_insert, max_insert,
+                                 insert_mean, insert_sd)
+    inserts = rng.choices(pool, weights, k=read_num)
+    skip = lambda: int(math.log(1.0-rng.random()) / math.log(1.0-error_rate))
+    err = skip() if 0 < error_rate < 1 else -1
+    for i in range(read_num):
+        x = rng.random()
+        if x < low_comp_rate:
+            unit = rng.choice(["CA", "GT", "AT", "TG", "AC"])
+            seq = (unit * read_len)[:read_len]
+        else:
+            seq = inserts[i]
+            if x < low_comp_rate + polya_rate:
+                seq += "A" * rng.randint(8, 20)
+            seq = (seq + adapter)[:read_len]
+            if len(seq) < read_len:
+                seq += "A" * (read_len-len(seq))
+        qual = "I" * len(seq)
+        if 0 <= err < len(seq):
+            seq, qual = list(seq), list(qual)
+            while err < len(seq):
+                seq[err] = rng.choice([b for b in "ACGTN" if b != seq[err]])
+                qual[err] = "#"
+                err += skip() + 1
+            seq, qual = "".join(seq), "".join(qual)
+        if err >= 0:
+            err -= len(seq)
+        yield "read{}".format(i+1), seq, qual
+
+
+class _BgzfWriter(io.RawIOBase):
+    """Binary stream writing BGZF blocks.
+
+    """
+
+    def __init__(self, fobj):
+        self.fobj = fobj
+        self.buf = b""
+
+    def writable(self):
+        return True
+
+    def _block(self, data):
+        comp = zlib.compressobj(6, zlib.DEFLATED, -15)
+        body = comp.compress(data) + comp.flush()
+        head = struct.pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff,
+                           6, 66, 67, 2, len(body) + 25)
+        tail = struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data))
+        self.fobj.write(head + body + tail)
+
+    def write(self, b):
+        self.buf += bytes(b)
+        while len(self.buf) >= BGZF_BLOCK:
+            self._block(self.buf[:BGZF_BLOCK])
+            self.buf = self.buf[BGZF_BLOCK:]
+        return len(b)
+
+    def close(self):
+        if not self.closed:
+            if self.buf:
+                self._block(self.buf)
+            self.fobj.write(BGZF_EOF)
+            self.fobj.close()
+        super(_BgzfWriter, self).close()
+
+
+class _ZstdPipe(object):
+    """Binary object writing through the zstd command.
+
+    """
+
+    def __init__(self, out_file):
+        self.proc = subprocess.Popen(["zstd", "-q", "-f", "-o", out_file],
+                                     stdin=subprocess.PIPE)
+
+    def write(self, b):
+        return self.proc.stdin.write(b)
+
+    def close(self):
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise Exception("failed: zstd")
+
+
+def _open_output(out_file, compression):
+    """Return a binary file object to write a compressed file.
+
+    """
+    if compression not in COMPRESSIONS:
+        raise Exception("bad compression: {}".format(compression))
+    if compression is None:
+        return open(out_file, "wb")
+    elif compression == "gz":
+        return gzip.open(out_file, "wb", compresslevel=6)
+    elif compression == "bgzf":
+        return _BgzfWriter(open(out_file, "wb"))
+    elif compression == "bz2":
+        return bz2.open(out_file, "wb")
+    elif compression == "xz":
+        return lzma.open(out_file, "wb")
+    elif zstandard is not None:
+        cctx = zstandard.ZstdCompressor()
+        return cctx.stream_writer(open(out_file, "wb"), closefd=True)
+    elif shutil.which("zstd"):
+        return _ZstdPipe(out_file)
+    raise Exception("can't compress {}: install zstd or "
+                    "zstandard".format(out_file))
+
+
+def write_fastq(out_file, reads, compression=None):
+    """Write reads of (name, sequence, quality) in FASTQ, and
+       return the number of the reads.
+
+    """
+    fobj = _open_output(out_file, compression)
+    num = 0
+    lines = []
+    for name, seq, qual in reads:
+        lines.append("@{}\n{}\n+\n{}\n".format(name, seq, qual))
+        num += 1
+        if len(lines) == 10000:
+            fobj.write("".join(lines).encode("ascii"))
+            lines = []
+    if lines:
+        fobj.write("".join(lines).encode("ascii"))
+    fobj.close()
+    return num
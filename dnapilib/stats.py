@@ -0,0 +1,215 @@
+"""Per-stage timing and memory statistics.
+
+   Statistics are off unless enable() is called; until then,
+   stage() returns a shared no-op context, timed functions are
+   called directly and get_file_obj returns plain file objects,
+   so disabled runs pay a single global check per call. Stages
+   are inclusive: 'read_input' is also part of the stages that
+   read FASTQ, for example.
+"""
+
+import sys
+import time
+import resource
+import functools
+
+
+STATS = None
+
+
+class _NoStage(object):
+    """Context of a stage when statistics are disabled.
+
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, reads=0, nbytes=0):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024.0 / 1024.0
+    return peak / 1024.0
+
+
+class _Stage(object):
+    """Context of a stage recording wall time, CPU time of the
+       process and its waited children, and processed items.
+
+    """
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.reads = 0
+        self.nbytes = 0
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.child = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return self
+
+    def __exit__(self, *exc):
+        child = resource.getrusage(resource.RUSAGE_CHILDREN)
+        child_cpu = (child.ru_utime - self.child.ru_utime +
+                     child.ru_stime - self.child.ru_stime)
+        self.stats.record(self.name, time.perf_counter() - self.wall,
+                          time.process_time() - self.cpu, child_cpu,
+                          self.reads, self.nbytes)
+        return False
+
+    def add(self, reads=0, nbytes=0):
+        """Add the numbers of processed reads and bytes.
+
+        """
+        self.reads += reads
+        self.nbytes += nbytes
+
+
+class Stats(object):
+    """Accumulate statistics of named stages.
+
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.cpu = time.process_time()
+        self.stages = {}
+        self.order = []
+
+    def record(self, name, wall, cpu, child_cpu=0.0, reads=0, nbytes=0):
+        if name not in self.stages:
+            self.order.append(name)
+            self.stages[name] = {"calls": 0, "wall": 0.0, "cpu": 0.0,
+                                 "child_cpu": 0.0, "reads": 0, "bytes": 0}
+        x = self.stages[name]
+        x["calls"] += 1
+        x["wall"] += wall
+        x["cpu"] += cpu
+        x["child_cpu"] += child_cpu
+        x["reads"] += reads
+        x["bytes"] += nbytes
+        x["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+
+    def report(self):
+        """Return a dictionary of the statistics.
+
+        """
+        stages = []
+        for name in self.order:
+            x = dict(self.stages[name])
+            for key in ("wall", "cpu", "child_cpu"):
+                x[key] = round(x[key], 4)
+            x["stage"] = name
+            stages.append(x)
+        return {"wall": round(time.perf_counter() - self.start, 4),
+                "cpu": round(time.process_time() - self.cpu, 4),
+                "peak_rss_mb": round(_peak_rss_mb(), 1),
+                "stages": stages}
+
+
+class _TimedReader(object):
+    """Binary file object recording the time spent waiting for
+       input (reading and decompression) and the bytes read.
+
+    """
+
+    def __init__(self, fobj, stats):
+        self.fobj = fobj
+        self.stats = stats
+
+    def _timed(self, func, *args):
+        wall, cpu = time.perf_counter(), time.process_time()
+        data = func(*args)
+        self.stats.record("read_input", time.perf_counter() - wall,
+                          time.process_time() - cpu, 0.0, 0, len(data))
+        return data
+
+    def read(self, *args):
+        return self._timed(self.fobj.read, *args)
+
+    def read1(self, *args):
+        return self._timed(self.fobj.read1, *args)
+
+    def peek(self, *args):
+        return self.fobj.peek(*args)
+
+    def readable(self):
+        return True
+
+    def __iter__(self):
+        return iter(self.fobj)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fobj.close()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.fobj, name)
+
+
+def enable():
+    """Start collecting statistics, and return the collector.
+
+    """
+    global STATS
+    STATS = Stats()
+    return STATS
+
+
+def disable():
+    global STATS
+    STATS = None
+
+
+def stage(name):
+    """Return a context recording a stage. Reads and bytes
+       processed in the stage are added with its add().
+
+    """
+    if STATS is None:
+        return _NO_STAGE
+    return _Stage(STATS, name)
+
+
+def timed(name, reads=False):
+    """Return a decorator recording calls of a function as a
+       stage. If reads is True, the function returns the number
+       of reads it processed.
+
+    """
+    def wrap(func):
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            if STATS is None:
+                return func(*args, **kwargs)
+            with _Stage(STATS, name) as st:
+                ret = func(*args, **kwargs)
+                if reads:
+                    st.add(reads=ret)
+            return ret
+        return timed_func
+    return wrap
+
+
+def timed_input(fobj):
+    """Return a binary file object whose reads are recorded.
+
+    """
+    if STATS is None:
+        return fobj
+    return _TimedReader(fobj, STATS)
@@ -0,0 +1,158 @@
+"""Binary store of collapsed reads.
+
+   A store is a directory of flat arrays in the native byte order,
+   which are memory-mapped when the store is opened:
+
+   seq     reads packed in 2 bits per base from byte boundaries, or
+           as ASCII if they have characters other than A, C, G, T
+   offset  int64 start of each read in seq
+   length  int32 length of each read, negative for ASCII reads
+   count   int64 count of each read
+
+   Reads are identified by their indices in the store, so FASTA
+   for mapping is exported with the indices as read names.
+"""
+
+import os
+import os.path
+import mmap
+from array import array
+
+from dnapilib.collapse import pack_bases
+from dnapilib.collapse import unpack_bases
+
+
+STORE_ARRAYS = (("offset", "q"), ("length", "i"), ("count", "q"))
+
+
+def _pack(seq):
+    """Return bytes of a read and its length to store.
+
+    """
+    L = len(seq)
+    val = pack_bases(seq)
+    if val is None:
+        return seq.encode("latin-1"), -L
+    nbytes = (L + 3) // 4
+    return (val << 2*(4*nbytes - L)).to_bytes(nbytes, "big"), L
+
+
+def write_store(path, items):
+    """Write (read, count) of distinct reads to a store, and return
+       the total count of the reads.
+
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    total = 0
+    pos = 0
+    with open(os.path.join(path, "seq"), "wb") as fseq:
+        arrays = dict((name, array(code)) for name, code in STORE_ARRAYS)
+        files = dict((name, open(os.path.join(path, name), "wb"))
+                     for name, code in STORE_ARRAYS)
+        buf = []
+        for seq, cnt in items:
+            data, L = _pack(seq)
+            buf.append(data)
+            arrays["offset"].append(pos)
+            arrays["length"].append(L)
+            arrays["count"].append(cnt)
+            pos += len(data)
+            total += cnt
+            if len(buf) == 100000:
+                fseq.write(b"".join(buf))
+                buf = []
+                for name in arrays:
+                    arrays[name].tofile(files[name])
+                    del arrays[name][:]
+        fseq.write(b"".join(buf))
+        for name in arrays:
+            arrays[name].tofile(files[name])
+            files[name].close()
+    return total
+
+
+def _map_file(path):
+    """Return a read-only mmap of a file, or empty bytes if it is
+       empty.
+
+    """
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ReadStore(object):
+    """Memory-mapped store of collapsed reads written by write_store.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._maps = [_map_file(os.path.join(path, "seq"))]
+        self.seq = memoryview(self._maps[0])
+        for name, code in STORE_ARRAYS:
+            m = _map_file(os.path.join(path, name))
+            self._maps.append(m)
+            setattr(self, name, memoryview(m).cast(code))
+
+    def __len__(self):
+        return len(self.count)
+
+    def read(self, i):
+        """Return the i-th read.
+
+        """
+        L = self.length[i]
+        beg = self.offset[i]
+        if L < 0:
+            return bytes(self.seq[beg : beg-L]).decode("latin-1")
+        data = self.seq[beg : beg + (L+3)//4]
+        return unpack_bases(data)[:L]
+
+    def reads(self):
+        """Return (read, count) of all the reads.
+
+        """
+        for i in range(len(self)):
+            yield self.read(i), self.count[i]
+
+    def total(self):
+        """Return the total count of the reads.
+
+        """
+        return sum(self.count)
+
+    def export_fasta(self, fasta, ids=True):
+        """Write the reads in FASTA named by their indices, or by
+           SEQ_COUNT as collapsed FASTA if ids is False.
+
+        """
+        with open(fasta, "w") as f:
+            buf = []
+            for i, (seq, cnt) in enumerate(self.reads()):
+                if ids:
+                    buf.append(">{}\n{}\n".format(i, seq))
+                else:
+                    buf.append(">{0}_{1}\n{0}\n".format(seq, cnt))
+                if len(buf) == 10000:
+                    f.write("".join(buf))
+                    buf = []
+            f.write("".join(buf))
+
+    def close(self):
+        for name, code in STORE_ARRAYS:
+            getattr(self, name).release()
+        self.seq.release()
+        for m in self._maps:
+            if m:
+                m.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,215 @@
+"""Functions to trim 3' adapters from reads.
+
+"""
+
+from dnapilib import stats
+from dnapilib.io_utils import fastq_lines
+from dnapilib.collapse import ReadCollapser
+
+
+TRIM_FORMATS = ("fastq", "fasta", "collapsed")
+
+
+class AdapterMatcher(object):
+    """Find the rightmost occurrence of an adapter seed in reads
+       with up to a given number of mismatches, or of edits
+       (mismatches, insertions and deletions) if indels is True.
+
+       Exact hits are found by a reverse string search. For
+       approximate hits, the seed is split into mismatches + 1
+       pieces, one of which occurs exactly in any hit; candidate
+       positions of the pieces are verified by counting mismatches
+       or by a banded edit distance. Hits with fewer edits (then
+       fewer indels) are preferred, and the rightmost one is taken
+       among them.
+    """
+
+    def __init__(self, seed, mismatches=0, indels=False):
+        seed = seed.upper().replace("U", "T")
+        if not seed:
+            raise Exception("empty adapter seed")
+        if mismatches < 0 or mismatches >= len(seed):
+            raise Exception("bad number of mismatches: {}".format(mismatches))
+        self.seed = seed
+        self.mismatches = mismatches
+        self.indels = indels
+        self.scale = len(seed) + mismatches + 1
+        step = len(seed) // (mismatches + 1)
+        self.pieces = []
+        for i in range(mismatches + 1):
+            end = len(seed) if i == mismatches else (i+1) * step
+            self.pieces.append((seed[i*step : end], i*step))
+
+    def _count_mismatches(self, seq, pos, limit):
+        mm = 0
+        for a, b in zip(self.seed, seq[pos : pos+len(self.seed)]):
+            if a != b:
+                mm += 1
+                if mm > limit:
+                    break
+        return mm
+
+    def _edit_cost(self, seq, pos):
+        """Return edits * scale + indels of the best alignment of
+           the seed to the read from pos, or a cost of more than
+           the allowed edits.
+
+        """
+        k, sc = self.mismatches, self.scale
+        text = seq[pos : pos+len(self.seed)+k]
+        n = len(text)
+        big = (k+1) * sc
+        prev = [j * (sc+1) if j <= k else big for j in range(n+1)]
+        for i, a in enumerate(self.seed, 1):
+            cur = [big] * (n+1)
+            if i <= k:
+                cur[0] = i * (sc+1)
+            for j in range(max(i-k, 1), min(i+k, n) + 1):
+                c = prev[j-1] if text[j-1] == a else prev[j-1] + sc
+                d = prev[j] + sc + 1
+                e = cur[j-1] + sc + 1
+                cur[j] = min(c, d, e)
+            if min(cur) >= big:
+                return big
+            prev = cur
+        return min(prev[max(len(self.seed)-k, 0):] or [big])
+
+    def find(self, seq):
+        """Return the start of the rightmost best seed hit in an
+           upper-case read and the number of edits, or (-1, None)
+           if there is no hit.
+
+        """
+        pos = seq.rfind(self.seed)
+        if pos >= 0 or not self.mismatches:
+            return pos, (0 if pos >= 0 else None)
+        seed_len, sc = len(self.seed), self.scale
+        shift = self.mismatches if self.indels else 0
+        best, best_cost = -1, (self.mismatches+1) * sc
+        for piece, offset in self.pieces:
+            end = len(seq)
+            while True:
+                p = seq.rfind(piece, 0, end)
+                if p < 0:
+                    break
+                end = p + len(piece) - 1
+                start = p - offset
+                if start + shift <= best and best_cost <= sc:
+                    break
+                for s in range(start + shift, start - shift - 1, -1):
+                    if s < 0 or s <= best and best_cost <= sc:
+                        break
+                    if self.indels:
+                        if s >= len(seq):
+                            continue
+                        cost = self._edit_cost(seq, s)
+                    else:
+                        if s + seed_len > len(seq):
+                            continue
+                        cost = sc * self._count_mismatches(
+                                        seq, s, best_cost // sc)
+                    if cost > self.mismatches * sc + shift:
+                        continue
+                    if cost < best_cost or (cost == best_cost and s > best):
+                        best, best_cost = s, cost
+        if best < 0:
+            return -1, None
+        return best, best_cost // sc
+
+
+def clip_reads(blocks, matcher, tm5=0, tm3=0, min_len=0, max_len=None,
+               keep_untrimmed=False, counts=None):
+    """Return blocks of FASTQ lines with 3' adapters trimmed from
+       blocks of FASTQ lines, adding the numbers of input, trimmed
+       and written reads to counts.
+
+       Bases are cut from the start of the adapter hit, and tm5
+       and tm3 bases are trimmed from the ends of the insert. Reads
+       without hits are written only if keep_untrimmed is True.
+       Hits are looked up once per distinct read in a block.
+    """
+    if max_len is None:
+        max_len = float("inf")
+    if counts is None:
+        counts = {}
+    for key in ("reads", "trimmed", "written"):
+        counts.setdefault(key, 0)
+    for lines in blocks:
+        cuts = {}
+        out = []
+        for i in range(0, len(lines) - 3, 4):
+            seq = lines[i+1]
+            end = cuts.get(seq)
+            if end is None:
+                end = matcher.find(seq.upper())[0]
+                cuts[seq] = end
+            if end < 0:
+                if not keep_untrimmed:
+                    continue
+                end = len(seq)
+            else:
+                counts["trimmed"] += 1
+            end -= tm3
+            L = end - tm5
+            if L < min_len or L > max_len:
+                continue
+            out += [lines[i], seq[tm5:end], lines[i+2], lines[i+3][tm5:end]]
+        counts["reads"] += len(lines) // 4
+        counts["written"] += len(out) // 4
+        yield out
+
+
+def write_reads(blocks, out, out_format="fastq", collapser=None):
+    """Write blocks of FASTQ lines to a binary file object in FASTQ
+       or FASTA, or as FASTA of distinct reads with the counts in
+       the names if out_format is 'collapsed'.
+
+       Distinct reads are counted by collapser, a ReadCollapser
+       (without a memory limit if None), and written in sorted order.
+    """
+    if out_format not in TRIM_FORMATS:
+        raise Exception("bad output format: {}".format(out_format))
+    if out_format == "collapsed":
+        if collapser is None:
+            collapser = ReadCollapser()
+        for lines in blocks:
+            reads = {}
+            for seq in lines[1::4]:
+                reads[seq] = reads.get(seq, 0) + 1
+            collapser.update(reads)
+        buf = []
+        for seq, cnt in collapser.items(sort=True):
+            buf.append(">{0}_{1}\n{0}\n".format(seq, cnt))
+            if len(buf) == 10000:
+                out.write("".join(buf).encode("latin-1"))
+                buf = []
+        out.write("".join(buf).encode("latin-1"))
+        collapser.close()
+    else:
+        fasta = out_format == "fasta"
+        for lines in blocks:
+            if not lines:
+                continue
+            if fasta:
+                buf = [">{}\n{}\n".format(name[1:], seq) for name, seq
+                       in zip(lines[0::4], lines[1::4])]
+                out.write("".join(buf).encode("latin-1"))
+            else:
+                out.write(("\n".join(lines) + "\n").encode("latin-1"))
+    out.flush()
+
+
+def trim_reads(fobj, out, matcher, tm5=0, tm3=0, min_len=0, max_len=None,
+               keep_untrimmed=False, out_format="fastq", collapser=None):
+    """Write reads of a binary FASTQ stream with 3' adapters trimmed
+       (see clip_reads and write_reads), and return a dictionary of
+       the numbers of input, trimmed and written reads.
+
+    """
+    counts = {}
+    with stats.stage("trim_reads") as st:
+        write_reads(clip_reads(fastq_lines(fobj), matcher, tm5, tm3,
+                               min_len, max_len, keep_untrimmed, counts),
+                    out, out_format, collapser)
+        st.add(reads=counts["reads"])
+    return counts
@@ -22,6 +22,9 @@ setup(name='DNApi',
       ],
       keywords='Adapter Prediction',
       packages=find_packages(),
+      extras_require={
+          'fast': ['numpy>=1.20'],
+      },
       scripts=[
           'dnapi.py',
           'utils/qual_offset.py',
@@ -0,0 +1,54 @@
+"""Shared fixtures of the tests.
+
+"""
+
+import random
+
+import pytest
+
+
+ADAPTER = "TGGAATTCTCGGGTGCCAAGG"
+
+
+def random_reads(rng, num, bases="ACGT", max_insert=30, max_len=40):
+    """Return reads of random inserts followed by ADAPTER, cut to
+       random lengths.
+
+    """
+    reads = []
+    for _ in range(num):
+        insert = "".join([rng.choice(bases)
+                          for _ in range(rng.randint(0, max_insert))])
+        reads.append((insert + ADAPTER)[:rng.randint(1, max_len)])
+    return reads
+
+
+def write_fastq(path, reads, qual="I"):
+    """Write reads to FASTQ with constant qualities.
+
+    """
+    with open(path, "w") as f:
+        for i, seq in enumerate(reads):
+            f.write("@r{}\n{}\n+\n{}\n".format(i, seq, qual * len(seq)))
+    return str(path)
+
+
+@pytest.fixture
+def rng():
+    return random.Random(1)
+
+
+@pytest.fixture
+def make_reads():
+    return random_reads
+
+
+@pytest.fixture
+def make_fastq():
+    return write_fastq
+
+
+@pytest.fixture
+def fastq(tmp_path, rng):
+    """FASTQ of 5000 reads with ADAPTER."""
+    return write_fastq(tmp_path / "reads.fq", random_reads(rng, 5000))
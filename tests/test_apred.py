@@ -0,0 +1,125 @@
+"""Tests of in-memory adapter prediction.
+
+"""
+
+import io
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from dnapilib.apred import Predictor, adaptive_adapter_prediction
+from dnapilib.apred import tee_prediction
+
+
+DNAPI = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "dnapi.py")
+
+
+def test_predictor_without_reads():
+    p = Predictor()
+    assert p.predict() == []
+    assert p.best() is None
+
+
+def test_predictor_all_kmers_filtered():
+    for kmer_lens, ratios in [((9, 11), (1.2, 1.3, 1.4)), ((9,), (1.2,))]:
+        p = Predictor(kmer_lens, ratios)
+        p.feed(["A" * 17] * 10)
+        assert p.predict() == []
+        assert p.best() is None
+
+
+def test_predictor_input_types(make_reads, rng):
+    reads = make_reads(rng, 2000)
+    fastq = "".join(["@r{}\n{}\n+\n{}\n".format(i, s, "I" * len(s))
+                     for i, s in enumerate(reads)])
+    expect = Predictor()
+    expect.feed(reads)
+    for data in [[s.encode() for s in reads], "\n".join(reads),
+                 fastq, fastq.encode()]:
+        p = Predictor()
+        assert p.feed(data) == len(reads)
+        assert p.predict() == expect.predict()
+    assert expect.best().startswith("TGGAATTCTCGG")
+
+
+def test_feed_until_stable(make_reads, rng):
+    reads = make_reads(rng, 50000)
+    p = Predictor()
+    num = p.feed_until_stable(reads, batch_size=2000, patience=3)
+    assert p.converged
+    assert num == p.read_count
+    assert 4 * 2000 <= num < len(reads)
+    assert p.best().startswith("TGGAATTCTCGG")
+
+
+def test_feed_until_stable_max_reads(make_reads, rng):
+    reads = make_reads(rng, 5000)
+    p = Predictor()
+    num = p.feed_until_stable(reads, batch_size=1000, patience=3,
+                              tolerance=0.0, max_reads=2500)
+    assert num == p.read_count == 2500
+    assert not p.converged
+
+
+def test_adaptive_prediction_sampling(fastq):
+    results = []
+    for _ in range(2):
+        p = adaptive_adapter_prediction(fastq, [1.2, 1.3, 1.4], [9, 11],
+                                        max_reads=4000, batch_size=500,
+                                        sampling="reservoir", seed=3)
+        results.append((p.read_count, p.predict()))
+    assert results[0] == results[1]
+    assert results[0][1][0][0].startswith("TGGAATTCTCGG")
+
+
+def _odd_fastq(reads):
+    """Return FASTQ bytes with CRLF and trailing spaces on some lines."""
+    recs = []
+    for i, seq in enumerate(reads):
+        end = "\r\n" if i % 3 == 0 else " \n" if i % 3 == 1 else "\n"
+        recs.append("@r{0} x{1}{2}{1}+{1}{3}{1}".format(
+            i, end, seq, "I" * len(seq)))
+    return "".join(recs).encode()
+
+
+def test_tee_prediction_copies_input(make_reads, rng):
+    data = _odd_fastq(make_reads(rng, 20000))
+    for adaptive in (None, {"batch_size": 1000}):
+        out = io.BytesIO()
+        seen = []
+        num = tee_prediction(io.BytesIO(data), out, Predictor(),
+                             lambda p: seen.append(p.best()), 3000, adaptive)
+        assert out.getvalue() == data
+        assert 0 < num < 20000
+        assert seen[0].startswith("TGGAATTCTCGG")
+
+
+def test_tee_prediction_copies_input_on_failure():
+    data = _odd_fastq(["A" * 30] * 5000)
+
+    def report(predictor):
+        if predictor.best() is None:
+            raise Exception("no adapters predicted")
+
+    out = io.BytesIO()
+    with pytest.raises(Exception, match="no adapters"):
+        tee_prediction(io.BytesIO(data), out, Predictor(), report, 1000)
+    assert out.getvalue() == data
+
+
+def test_tee_mode(tmp_path, make_reads, rng):
+    data = _odd_fastq(make_reads(rng, 5000))
+    fastq = tmp_path / "reads.fq"
+    fastq.write_bytes(data)
+    pred = tmp_path / "pred.json"
+    out = subprocess.run([sys.executable, DNAPI, str(fastq), "--tee", "-",
+                          "--prediction-json", str(pred)],
+                         stdout=subprocess.PIPE, check=True).stdout
+    assert out == data
+    result = json.loads(pred.read_text())
+    assert result["reads"] == 5000
+    assert result["adapters"][0]["seq"].startswith("TGGAATTCTCGG")
@@ -0,0 +1,37 @@
+import json
+
+from dnapilib.batch import batch_prediction, format_result
+from dnapilib.batch import unique_samples, sample_name, TSV_HEADER
+
+
+def test_unique_samples():
+    files = ["x/a.fq", "x/a.fq.gz", "y/b.fq", "x/a.fq"]
+    samples = unique_samples([(sample_name(fq), fq) for fq in files])
+    assert samples == [("x/a.fq#1", "x/a.fq"), ("x/a.fq.gz", "x/a.fq.gz"),
+                       ("b", "y/b.fq"), ("x/a.fq#2", "x/a.fq")]
+
+
+def test_batch_prediction_rows(tmp_path, fastq, make_fastq):
+    bad = tmp_path / "bad.fq.gz"
+    bad.write_bytes(b"\x1f\x8b\x08\x00truncated")
+    polya = make_fastq(tmp_path / "polya.fq", ["A" * 20] * 10)
+    samples = [("good", fastq), ("bad", str(bad)),
+               ("missing", str(tmp_path / "missing.fq")), ("polya", polya)]
+    results = sorted(batch_prediction(samples, [1.4], [9], 5000, jobs=2))
+    assert [r[0] for r in results] == ["bad", "good", "missing", "polya"]
+    columns = len(TSV_HEADER.split("\t"))
+    for result in results:
+        for line in format_result(result, show_all=True).split("\n"):
+            assert len(line.split("\t")) == columns
+    good = format_result(results[1]).split("\t")
+    assert good[0] == "good" and good[-1] == "NA"
+    assert good[1].startswith("TGGAATTCTCGG")
+    assert format_result(results[3]).split("\t")[1:] == \
+        ["NA", "NA", polya, "NA"]
+    for result in (results[0], results[2]):
+        row = format_result(result).split("\t")
+        assert row[1:3] == ["NA", "NA"] and row[-1] != "NA"
+        out = json.loads(format_result(result, "json"))
+        assert "error" in out and "adapters" not in out
+    out = json.loads(format_result(results[1], "json"))
+    assert out["adapters"][0]["seq"].startswith("TGGAATTCTCGG")
@@ -0,0 +1,59 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from dnapilib.apred import count_fastq_kmers
+from dnapilib.cache import KmerCache, CachedCounter
+
+
+DNAPI = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "dnapi.py")
+
+MAPPER = r"""import sys
+recs = open(sys.argv[1]).read().split("\n")
+with open(sys.argv[2], "w") as f:
+    for i in range(0, len(recs) - 1, 2):
+        ref = "chr1" if recs[i+1].startswith("A") else "*"
+        f.write("{}\t0\t{}\t1\n".format(recs[i][1:], ref))
+"""
+
+
+def test_cache_key(tmp_path, fastq):
+    cache = KmerCache(str(tmp_path / "cache"))
+    assert cache.key("-", 9, 100) is None
+    assert cache.key(fastq, 9, 100, "reservoir") is None
+    assert cache.key(fastq, 9, 100, "reservoir", 1) is not None
+    assert cache.key(fastq, 9, 100, "head", 1) == cache.key(fastq, 9, 100)
+
+
+def test_cached_counts(tmp_path, fastq):
+    cache = KmerCache(str(tmp_path / "cache"))
+    exact = count_fastq_kmers(fastq, [9, 11], 3000)
+    first = count_fastq_kmers(fastq, [9], 3000, cache=cache)
+    second = count_fastq_kmers(fastq, [9, 11], 3000, cache=cache)
+    assert isinstance(second, CachedCounter)
+    assert len(os.listdir(cache.cache_dir)) == 2
+    for k in (9, 11):
+        assert second.frequency(k) == exact.frequency(k)
+    assert first.frequency(9) == exact.frequency(9)
+    assert second.read_count == exact.read_count == 3000
+
+
+def test_exhaustive_mode_uses_cache(tmp_path, fastq):
+    mapper = tmp_path / "mapper.py"
+    mapper.write_text(MAPPER)
+    command = [sys.executable, DNAPI, fastq, "--no-output-files",
+               "--map-command",
+               "{} {} @in @out".format(sys.executable, mapper),
+               "--cache-dir", str(tmp_path / "cache"),
+               "--temp-dir", str(tmp_path)]
+    outs = [subprocess.run(command, stdout=subprocess.PIPE, check=True,
+                           universal_newlines=True).stdout
+            for _ in range(2)]
+    assert len(os.listdir(str(tmp_path / "cache"))) == 2
+    assert outs[0] == outs[1]
+    assert "TGGAATTCTCGG" in outs[0]
@@ -0,0 +1,56 @@
+import os
+import random
+from collections import Counter
+
+import pytest
+
+from dnapilib.collapse import ReadCollapser, pack_read, unpack_read
+
+
+def edge_reads(rng, num):
+    """Return reads of edge-case lengths and characters."""
+    reads = []
+    for _ in range(num):
+        L = rng.choice([0, 1, 5, 20, 63, 64, 65, 80])
+        bases = rng.choice(["ACGT", "AC", "ACGTN", "ACGT0123_+ "])
+        reads.append("".join([rng.choice(bases) for _ in range(L)]))
+    return reads
+
+
+@pytest.fixture
+def reads():
+    rng = random.Random(6)
+    pool = edge_reads(rng, 3000)
+    return [rng.choice(pool) for _ in range(20000)]
+
+
+def test_pack_read(reads):
+    for seq in set(reads) | set(["A_C", " AC", "+AC", "0123"]):
+        assert unpack_read(pack_read(seq)) == seq
+    for seq in ("A_C", " AC", "+AC", "0123", "ACGN", "A" * 65):
+        assert pack_read(seq) == seq
+    packed = sorted([pack_read(s) for s in set(reads)
+                     if not isinstance(pack_read(s), str)])
+    unpacked = [unpack_read(k) for k in packed]
+    assert unpacked == sorted(unpacked)
+
+
+@pytest.mark.parametrize("packed", [False, True])
+@pytest.mark.parametrize("memory", [None, 20000])
+def test_collapse_same_as_counter(tmp_path, reads, packed, memory):
+    expected = Counter(reads)
+    fas = ReadCollapser(memory, str(tmp_path), packed)
+    for i in range(0, len(reads), 1000):
+        fas.update(Counter(reads[i:i+1000]))
+    assert fas.read_count == len(reads)
+    assert bool(fas.runs) == bool(memory)
+    assert list(fas.items(sort=True)) == sorted(expected.items())
+    fas.close()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_collapse_first_appearance_order(reads):
+    fas = ReadCollapser(packed=True)
+    for seq in reads:
+        fas.add(seq)
+    assert list(fas.items()) == list(Counter(reads).items())
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+from collections import Counter
+
+import pytest
+
+from dnapilib import exhaust
+from dnapilib.exhaust import clip_adapter, clip_adapters, map_reads
+from dnapilib.store import write_store
+
+
+def test_clip_adapters_same_as_clip_adapter(rng, make_reads, make_fastq,
+                                            tmp_path, monkeypatch):
+    reads = make_reads(rng, 3000, "ACGTN", max_len=50)
+    reads = [x.lower() if rng.random() < 0.1 else x for x in reads]
+    fastq = make_fastq(tmp_path / "reads.fq", reads)
+    seeds = ["TGGAATT", "TGGAATTCTC", "GGAA", "ACGTAC", "RAW_INPUT"]
+    for memory in (None, 4000):
+        monkeypatch.setattr(exhaust, "COLLAPSE_MEMORY", memory)
+        with open(fastq, "rb") as f:
+            tables = clip_adapters(f, seeds, 1, 1, 3, 30, str(tmp_path))
+        with open(fastq, "rb") as f:
+            assert dict(tables.pop("RAW_INPUT").items()) == Counter(
+                [x for lines in exhaust.fastq_lines(f) for x in lines[1::4]])
+        for seed, table in tables.items():
+            with open(fastq) as f:
+                expected = Counter(clip_adapter(f, seed, 1, 1, 3, 30))
+            assert dict(table.items()) == expected
+
+
+MAPPER = r"""import sys
+recs = open(sys.argv[1]).read().split("\n")
+with open(sys.argv[2], "w") as f:
+    f.write("@SQ\tSN:chr1\tLN:1000\n")
+    for i in range(0, len(recs) - 1, 2):
+        ref = "chr1" if recs[i+1].startswith("A") else "*"
+        f.write("{}\t0\t{}\t1\n".format(recs[i][1:], ref))
+"""
+
+CHILD = r"""import os, sys, time
+open(sys.argv[1], "w").write(str(os.getpid()))
+with open(sys.argv[2], "wb") as f:
+    f.write(b"\x1f\x8b\x08\x04" + b"\0" * 20)
+time.sleep(60)
+"""
+
+
+def _write_reads(temp_dir, adapter, reads):
+    path = os.path.join(temp_dir, "insert_{}.reads".format(adapter))
+    return write_store(path, Counter(reads).items())
+
+
+def test_map_reads(tmp_path):
+    mapper = tmp_path / "mapper.py"
+    mapper.write_text(MAPPER)
+    reads = ["ACGT", "AAAA", "CCCC", "ACGT", "GGGG", "ATAT"]
+    _write_reads(str(tmp_path), "X", reads)
+    command = "{} {} @in @out".format(sys.executable, mapper)
+    for stream in (False, True):
+        assert map_reads("X", command, str(tmp_path), stream) == 4
+    for command, error in (("false @in @out", "mapping failed"),
+                           ("true @in @out", "can't open SAM")):
+        for stream in (False, True):
+            with pytest.raises(Exception, match=error):
+                map_reads("X", command, str(tmp_path), stream)
+
+
+def test_map_stream_kills_mapper(tmp_path):
+    _write_reads(str(tmp_path), "X", ["ACGT"])
+    pid_file = tmp_path / "pid"
+    script = tmp_path / "child.py"
+    script.write_text(CHILD)
+    command = "{} {} {} @out; true".format(sys.executable, script, pid_file)
+    with pytest.raises(Exception):
+        map_reads("X", command, str(tmp_path), stream=True)
+    pid = int(pid_file.read_text())
+    for _ in range(100):
+        if not _running(pid):
+            break
+        time.sleep(0.05)
+    assert not _running(pid)
+
+
+def _running(pid):
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            return f.read().split(") ")[1][0] != "Z"
+    except IOError:
+        return False
@@ -0,0 +1,86 @@
+import io
+import bz2
+import gzip
+import lzma
+import shutil
+import subprocess
+
+import pytest
+
+from dnapilib.io_utils import chunk_lines, fastq_lines, fastq_sequence
+from dnapilib.io_utils import get_file_obj, DECOMPRESS_MODES
+from dnapilib.io_utils import _PipeStream, _ThreadStream
+
+
+FASTQ = "".join(["@r{}\nACGT{}\n+\nIIII{}\n".format(i, "A"*i, "I"*i)
+                 for i in range(50)])
+
+
+def test_fastq_lines_keep_whole_records():
+    expected = FASTQ.split("\n")[:-1]
+    for size in (1, 7, 64, 1000, 10**6):
+        blocks = list(fastq_lines(io.BytesIO(FASTQ.encode()), size))
+        assert all(len(lines) % 4 == 0 for lines in blocks)
+        assert sum(blocks, []) == expected
+
+
+def test_fastq_lines_strip_lines():
+    text = FASTQ.replace("\n", " \r\n").rstrip("\n")
+    lines = sum(fastq_lines(io.BytesIO(text.encode()), 100), [])
+    assert lines == FASTQ.split("\n")[:-1]
+    lines = sum(fastq_lines(io.StringIO(text)), [])
+    assert lines == FASTQ.split("\n")[:-1]
+
+
+def test_fastq_sequence_from_line_iterator():
+    seqs = list(fastq_sequence(iter(FASTQ.splitlines(True))))
+    assert seqs == FASTQ.split("\n")[1::4]
+
+
+def test_chunk_lines_any_line_count():
+    text = "@HD\tVN:1.6\nr1\t0\tchr1\nr2\t4\t*"
+    for size in (1, 5, 100):
+        lines = sum(chunk_lines(io.BytesIO(text.encode()), size), [])
+        assert lines == text.split("\n")
+
+
+class _FailingReader(io.RawIOBase):
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        raise ValueError("corrupt input")
+
+
+def test_thread_stream_keeps_raising():
+    stream = _ThreadStream(_FailingReader())
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            stream.readinto(bytearray(10))
+    stream.close()
+
+
+def test_pipe_stream_raises_on_failure():
+    stream = io.BufferedReader(_PipeStream(["sh", "-c", "echo x; exit 3"]))
+    with pytest.raises(Exception, match="failed"):
+        stream.read()
+    stream.close()
+
+
+@pytest.mark.parametrize("ext", [".gz", ".bz2", ".xz", ".zst"])
+@pytest.mark.parametrize("mode", DECOMPRESS_MODES)
+def test_compressed_input(tmp_path, ext, mode):
+    if ext == ".zst" and shutil.which("zstd") is None:
+        pytest.skip("requires zstd")
+    path = str(tmp_path / ("reads.fq" + ext))
+    if ext == ".zst":
+        subprocess.run(["zstd", "-q", "-o", path], input=FASTQ.encode(),
+                       check=True)
+    else:
+        opener = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}[ext]
+        with opener(path, "wb") as f:
+            f.write(FASTQ.encode())
+    fobj = get_file_obj(path, binary=True, decompress=mode)
+    assert list(fastq_sequence(fobj)) == FASTQ.split("\n")[1::4]
+    fobj.close()
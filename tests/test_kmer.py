@@ -0,0 +1,105 @@
+from dnapilib import kmer
+from dnapilib.kmer import KmerCounter, count_kmers
+from dnapilib.kmer import SketchCounter, compare_frequency
+from dnapilib.kmer import assemble_kmers, _assemble_naive
+
+import pytest
+
+
+needs_numpy = pytest.mark.skipif(kmer.np is None, reason="requires numpy")
+
+
+@needs_numpy
+def test_packed_counts_same_as_dict(rng, make_reads):
+    reads = make_reads(rng, 2000, "ACGTACGTN")
+    kmer_lens = [3, 9, 12, 20]
+    exact = KmerCounter(kmer_lens, packed=False)
+    exact.update(reads)
+    packed = KmerCounter(kmer_lens, batch_size=300, packed=True)
+    packed.update(reads)
+    for k in kmer_lens:
+        assert packed.frequency(k) == exact.frequency(k)
+
+
+def test_count_kmers_same_as_dict(rng, make_reads):
+    reads = make_reads(rng, 1000)
+    for k in (5, 11):
+        exact = KmerCounter([k], packed=False)
+        exact.update(reads, 500)
+        assert count_kmers(reads, k, 500) == exact.frequency(k)
+
+
+def test_assemble_same_as_naive(rng, make_reads):
+    for _ in range(200):
+        k = rng.randint(4, 9)
+        reads = make_reads(rng, 50, rng.choice(["ACGT", "AC"]))
+        freq = count_kmers(reads, k, None)[:rng.randint(1, 40)]
+        seed = rng.randint(1, k-1)
+        assert (assemble_kmers(list(freq), seed) ==
+                _assemble_naive(list(freq), seed))
+
+
+@needs_numpy
+def test_sketch_counts_within_error_bound(rng, make_reads):
+    reads = make_reads(rng, 3000, "ACGTN")
+    exact = KmerCounter([9, 11])
+    exact.update(reads)
+    sketch = SketchCounter([9, 11], width=2**12, capacity=10**6,
+                           batch_size=500)
+    sketch.update(reads)
+    for k in (9, 11):
+        counts = dict(exact.frequency(k))
+        approx = dict(sketch.frequency(k))
+        assert set(approx) == set(s for s in counts if "N" not in s)
+        bound = sketch.error_bound(k)
+        over = [approx[s] - counts[s] for s in approx]
+        assert min(over) >= 0
+        assert sum([e > bound for e in over]) <= 0.05 * len(over)
+
+
+@needs_numpy
+def test_sketch_keeps_heavy_hitters(rng, make_reads):
+    reads = make_reads(rng, 5000)
+    exact = KmerCounter([9])
+    exact.update(reads)
+    sketch = SketchCounter([9], width=2**16, capacity=50, batch_size=200)
+    sketch.update(reads)
+    freq = sketch.frequency(9)
+    assert len(freq) == 50
+    assert [n for s, n in freq] == sorted([n for s, n in freq],
+                                          reverse=True)
+    found = dict(freq)
+    for s, n in exact.frequency(9)[:10]:
+        assert found[s] >= n
+    stats = compare_frequency(freq, exact.frequency(9), 10)
+    assert stats["recall"] == 1.0
+
+
+def _low_complexity_kmers(rng, kmer_len, num):
+    kmers = []
+    for _ in range(num):
+        unit = "".join([rng.choice("ACGTN") for _ in range(rng.randint(1, 4))])
+        s = unit * kmer_len
+        start = rng.randint(0, kmer_len)
+        s = "".join([rng.choice("ACGTN") for _ in range(start)]) + s
+        s = list(s[:kmer_len])
+        for _ in range(rng.randint(0, 3)):
+            s[rng.randrange(kmer_len)] = rng.choice("ACGT")
+        kmers.append("".join(s))
+    return kmers
+
+
+@needs_numpy
+def test_low_complexity_same_as_naive(rng):
+    measures = [("homopolymer",), ("dinucleotide",), ("dust",),
+                kmer.COMPLEXITY_MEASURES]
+    for kmer_len in (9, 11, 16):
+        kmers = _low_complexity_kmers(rng, kmer_len, 3000)
+        for m in measures:
+            flags = kmer.low_complexity(kmers, kmer_len, m)
+            expected = kmer._low_complexity_naive(kmers, kmer_len, m)
+            assert flags.tolist() == expected
+            assert 0 < sum(expected) < len(kmers)
+    flags = kmer.low_complexity(["AAAAATGCG", "ATATATATG", "TGGAATTCT"], 9,
+                                ("homopolymer", "dinucleotide"))
+    assert flags.tolist() == [True, True, False]
@@ -0,0 +1,58 @@
+import io
+import random
+
+import pytest
+
+from dnapilib.apred import Predictor, iterative_adapter_prediction
+from dnapilib.io_utils import fastq_lines
+from dnapilib.pipeline import qc_pipeline
+from dnapilib.quality import guess_qual_offset, platform_phred
+from dnapilib.quality import phred_table, quality_trim
+from dnapilib.simulate import simulate_reads, write_fastq
+from dnapilib.trim import AdapterMatcher, trim_reads, write_reads
+
+
+def _degraded_fastq(path, num, base=33):
+    """Write simulated reads with low quality 3' ends of random
+       lengths."""
+    rng = random.Random(7)
+    reads = []
+    for name, seq, qual in simulate_reads(num, seed=2):
+        cut = rng.randint(len(seq) // 2, len(seq))
+        qual = "".join([chr(ord(c) - 33 + base) for c in qual])
+        qual = qual[:cut] + chr(base + 2) * (len(seq) - cut)
+        reads.append((name, seq, qual))
+    write_fastq(str(path), reads)
+    return str(path)
+
+
+@pytest.mark.parametrize("out_format", ["fastq", "collapsed"])
+@pytest.mark.parametrize("base", [33, 64])
+def test_qc_pipeline_same_as_stages(tmp_path, out_format, base):
+    fastq = _degraded_fastq(tmp_path / "reads.fq", 6000, base)
+    sample_num = 2000
+
+    name, offset = guess_qual_offset(fastq)
+    table = phred_table(offset, platform_phred(name))
+    qtrimmed = str(tmp_path / "qtrimmed.fq")
+    with open(fastq, "rb") as f, open(qtrimmed, "wb") as out:
+        write_reads(quality_trim(fastq_lines(f), table, 20), out)
+    adapter = iterative_adapter_prediction(qtrimmed, [1.2, 1.3, 1.4],
+                                           [9, 11], sample_num)[0][0]
+    expected = io.BytesIO()
+    with open(qtrimmed, "rb") as f:
+        counts = trim_reads(f, expected, AdapterMatcher(adapter[:7]),
+                            1, 1, 16, 36, False, out_format)
+
+    out = io.BytesIO()
+    with open(fastq, "rb") as f:
+        result = qc_pipeline(f, out, Predictor([9, 11], [1.2, 1.3, 1.4]),
+                             qual_cutoff=20, tm5=1, tm3=1, min_len=16,
+                             max_len=36, out_format=out_format,
+                             sample_num=sample_num)
+    assert result["adapter"] == adapter
+    assert result["encoding"] == name
+    assert result["reads"] == 6000
+    assert result["trimmed"] == counts["trimmed"] > 0
+    assert result["written"] == counts["written"] > 0
+    assert out.getvalue() == expected.getvalue()
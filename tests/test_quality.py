@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from dnapilib import quality
+from dnapilib.quality import phred_table, trim_points, trim_points_np
+from dnapilib.quality import illumina_33, solexa_to_phred
+from dnapilib.quality import QualityEncoding, PLATFORMS
+
+
+def test_trim_points():
+    table = phred_table(33, illumina_33)
+    quals = ["IIIII###", "#####", "IIII", "I#I##", ""]
+    assert trim_points(quals, table, 20) == [5, 0, 4, 3, 0]
+    assert trim_points(quals, table, 0) == [8, 5, 4, 5, 0]
+
+
+@pytest.mark.skipif(quality.np is None, reason="requires numpy")
+def test_trim_points_np_same_as_loop():
+    rng = random.Random(4)
+    tables = [(phred_table(33, illumina_33), 33, 74),
+              (phred_table(64, solexa_to_phred), 59, 104)]
+    for table, low, high in tables:
+        for cutoff in (0, 10, 20, 30):
+            for fixed in (True, False):
+                width = rng.randint(1, 40)
+                quals = []
+                for _ in range(500):
+                    L = width if fixed else rng.randint(0, 40)
+                    quals.append("".join([chr(rng.randint(low, high))
+                                          for _ in range(L)]))
+                expected = trim_points(quals, table, cutoff)
+                assert trim_points_np(quals, table, cutoff) == expected
+
+
+def guess_all(quals):
+    """Return the guess from the whole range of characters."""
+    q_int = sorted(set(map(ord, "".join(quals))))
+    if len(q_int) <= 1:
+        return None
+    for pl in PLATFORMS:
+        if pl[1] <= q_int[1] and q_int[-2] <= pl[2]:
+            return pl[0], pl[3]
+    return None
+
+
+def test_quality_encoding_early_exit_same_as_whole():
+    rng = random.Random(5)
+    for _ in range(500):
+        quals = []
+        for _ in range(rng.randint(1, 20)):
+            low = rng.randint(33, 110)
+            high = rng.randint(low, low + 50)
+            quals.append("".join([chr(rng.randint(low, high))
+                                  for _ in range(rng.randint(0, 30))]))
+        enc = QualityEncoding()
+        for i in range(0, len(quals), 3):
+            if enc.update(quals[i:i+3]):
+                break
+        try:
+            guess = enc.guess()
+        except Exception:
+            guess = None
+        # a settled guess can only turn unknown with more reads
+        expected = guess_all(quals)
+        if expected is not None or not enc.settled():
+            assert guess == expected
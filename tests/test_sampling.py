@@ -0,0 +1,52 @@
+from dnapilib.io_utils import get_file_obj
+from dnapilib.sampling import reservoir_sample, seek_sample
+from dnapilib.simulate import write_fastq
+
+
+def indexed_reads(num):
+    """Return reads encoding their indices in 10 bases."""
+    return ["".join(["ACGT"[(i >> s) & 3] for s in range(18, -2, -2)])
+            for i in range(num)]
+
+
+def to_index(seq):
+    return int(seq.translate(str.maketrans("ACGT", "0123")), 4)
+
+
+def write_indexed(path, num, compression=None):
+    reads = [("r{}".format(i), seq, "I" * len(seq))
+             for i, seq in enumerate(indexed_reads(num))]
+    write_fastq(str(path), reads, compression)
+    return str(path)
+
+
+def test_reservoir_sample(tmp_path):
+    fastq = write_indexed(tmp_path / "reads.fq", 20000)
+    fobj = get_file_obj(fastq, binary=True)
+    sampled = [to_index(x) for x in reservoir_sample(fobj, 1000, seed=7)]
+    fobj.close()
+    assert len(set(sampled)) == 1000
+    assert sampled == sorted(sampled)
+    assert 8000 < sum(sampled) / 1000.0 < 12000
+    fobj = get_file_obj(fastq, binary=True)
+    assert [to_index(x) for x in reservoir_sample(fobj, 1000, seed=7)] \
+        == sampled
+    fobj.close()
+
+
+def test_reservoir_sample_small_file(tmp_path):
+    fastq = write_indexed(tmp_path / "reads.fq", 50)
+    fobj = get_file_obj(fastq, binary=True)
+    assert reservoir_sample(fobj, 100, seed=1) == indexed_reads(50)
+    fobj.close()
+
+
+def test_seek_sample(tmp_path):
+    for name, compression in (("reads.fq", None), ("reads.fq.gz", "bgzf")):
+        fastq = write_indexed(tmp_path / name, 50000, compression)
+        seqs = seek_sample(fastq, 500, seed=3)
+        assert len(seqs) == 500 and all(len(x) == 10 for x in seqs)
+        sampled = [to_index(x) for x in seqs]
+        assert all(0 <= i < 50000 for i in sampled)
+        assert max(sampled) > 25000
+        assert seek_sample(fastq, 500, seed=3) == seqs
@@ -0,0 +1,50 @@
+import os
+import random
+
+from dnapilib.store import ReadStore, write_store
+
+
+def test_store_round_trip(tmp_path):
+    rng = random.Random(6)
+    items = []
+    for i in range(3000):
+        L = rng.choice([0, 1, 3, 4, 5, 20, 64, 80])
+        bases = rng.choice(["ACGT", "ACGTN", "ACGT0123_+ "])
+        items.append(("".join([rng.choice(bases) for _ in range(L)]),
+                      rng.randint(1, 1000)))
+    items = list(dict(items).items())
+    total = sum([cnt for seq, cnt in items])
+    path = str(tmp_path / "reads")
+    assert write_store(path, items) == total
+    with ReadStore(path) as store:
+        assert len(store) == len(items)
+        assert list(store.reads()) == items
+        assert store.read(len(items) - 1) == items[-1][0]
+        assert store.total() == total
+        fasta = str(tmp_path / "reads.fa")
+        store.export_fasta(fasta)
+        with open(fasta) as f:
+            lines = f.read().split("\n")
+        assert lines[0::2][:len(items)] == [">{}".format(i)
+                                            for i in range(len(items))]
+        assert lines[1::2][:len(items)] == [seq for seq, cnt in items]
+        store.export_fasta(fasta, ids=False)
+        with open(fasta) as f:
+            assert f.readline() == ">{0}_{1}\n".format(*items[0])
+
+
+def test_store_many_and_no_reads(tmp_path):
+    items = [("".join(["ACGT"[(i >> s) & 3] for s in range(0, 18, 2)]), i)
+             for i in range(100005)]
+    path = str(tmp_path / "many")
+    write_store(path, items)
+    with ReadStore(path) as store:
+        assert len(store) == len(items)
+        assert store.read(100004) == items[100004][0]
+        assert store.count[100004] == 100004
+    path = str(tmp_path / "empty")
+    assert write_store(path, []) == 0
+    assert sorted(os.listdir(path)) == ["count", "length", "offset", "seq"]
+    with ReadStore(path) as store:
+        assert len(store) == 0
+        assert list(store.reads()) == []
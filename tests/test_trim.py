@@ -0,0 +1,142 @@
+import io
+import os
+import random
+from collections import Counter
+
+from dnapilib.collapse import ReadCollapser
+from dnapilib.trim import AdapterMatcher, clip_reads, write_reads
+
+
+def _blocks(reads, size=7):
+    lines = []
+    for i, seq in enumerate(reads):
+        lines += ["@r{}".format(i), seq, "+", "I" * len(seq)]
+    return [lines[i : i+4*size] for i in range(0, len(lines), 4*size)]
+
+
+def test_clip_reads():
+    reads = ["ACGTACGTTGGAATTC", "ACGTTGGAATTCTGG", "CCCCCCCC",
+             "TGGAATTC", "GGGGGGGGGGGGTGGAATT"]
+    counts = {}
+    blocks = clip_reads(_blocks(reads, 2), AdapterMatcher("TGGAATT"),
+                        tm5=1, tm3=1, min_len=2, max_len=10, counts=counts)
+    lines = [x for b in blocks for x in b]
+    assert lines[1::4] == ["CGTACG", "CG", "GGGGGGGGGG"]
+    assert lines[3::4] == ["I" * 6, "I" * 2, "I" * 10]
+    assert lines[0::4] == ["@r0", "@r1", "@r4"]
+    assert counts == {"reads": 5, "trimmed": 4, "written": 3}
+
+    counts = {}
+    blocks = clip_reads(_blocks(reads), AdapterMatcher("TGGAATT"),
+                        keep_untrimmed=True, counts=counts)
+    lines = [x for b in blocks for x in b]
+    assert lines[1::4] == ["ACGTACGT", "ACGT", "CCCCCCCC", "",
+                           "GGGGGGGGGGGG"]
+    assert counts == {"reads": 5, "trimmed": 4, "written": 5}
+
+
+def test_write_reads_formats():
+    reads = ["ACGT", "GGA", "ACGT"]
+    out = io.BytesIO()
+    write_reads(_blocks(reads, 2), out)
+    assert out.getvalue() == (b"@r0\nACGT\n+\nIIII\n@r1\nGGA\n+\nIII\n"
+                              b"@r2\nACGT\n+\nIIII\n")
+    out = io.BytesIO()
+    write_reads(_blocks(reads, 2), out, "fasta")
+    assert out.getvalue() == b">r0\nACGT\n>r1\nGGA\n>r2\nACGT\n"
+    out = io.BytesIO()
+    write_reads(_blocks(reads, 2), out, "collapsed")
+    assert out.getvalue() == b">ACGT_2\nACGT\n>GGA_1\nGGA\n"
+
+
+def test_write_reads_collapsed_spilled(tmp_path, rng, make_reads):
+    reads = make_reads(rng, 5000, "ACGTN")
+    expected = "".join([">{0}_{1}\n{0}\n".format(s, n)
+                        for s, n in sorted(Counter(reads).items())])
+    for packed in (False, True):
+        collapser = ReadCollapser(2000, str(tmp_path), packed)
+        out = io.BytesIO()
+        write_reads(_blocks(reads, 100), out, "collapsed", collapser)
+        assert out.getvalue().decode() == expected
+        assert not os.listdir(str(tmp_path))
+
+
+def brute_mismatch(seed, seq, mismatches):
+    """Return the rightmost hit with the fewest mismatches."""
+    best = (-1, None)
+    for s in range(len(seq) - len(seed) + 1):
+        mm = sum([a != b for a, b in zip(seed, seq[s:])])
+        if mm <= mismatches and (best[1] is None or mm <= best[1]):
+            best = (s, mm)
+    return best
+
+
+def edit_cost(seed, text, scale):
+    """Return edits * scale + indels of the best alignment of seed
+       to a prefix of text, allowing the alignment to skip bases at
+       the start of text.
+
+    """
+    n = len(text)
+    prev = [j * (scale+1) for j in range(n+1)]
+    for i, a in enumerate(seed, 1):
+        cur = [i * (scale+1)] + [0] * n
+        for j in range(1, n+1):
+            cur[j] = min(prev[j-1] + (0 if text[j-1] == a else scale),
+                         prev[j] + scale + 1, cur[j-1] + scale + 1)
+        prev = cur
+    return min(prev)
+
+
+def brute_indel(seed, seq, mismatches):
+    """Return the rightmost hit with the fewest edits, then indels."""
+    scale = len(seed) + mismatches + 1
+    best, best_cost = -1, None
+    for s in range(len(seq)):
+        cost = edit_cost(seed, seq[s : s+len(seed)+mismatches], scale)
+        if cost // scale > mismatches:
+            continue
+        if best_cost is None or cost <= best_cost:
+            best, best_cost = s, cost
+    if best < 0:
+        return -1, None
+    return best, best_cost // scale
+
+
+def _mutate(rng, seq, edits, indels):
+    seq = list(seq)
+    for _ in range(edits):
+        op = rng.choice("sid" if indels else "s")
+        i = rng.randrange(len(seq))
+        if op == "s":
+            seq[i] = rng.choice("ACGTN")
+        elif op == "i":
+            seq.insert(i, rng.choice("ACGT"))
+        elif len(seq) > 1:
+            del seq[i]
+    return "".join(seq)
+
+
+def _matcher_cases(indels):
+    rng = random.Random(3)
+    for _ in range(3000):
+        seed = "".join([rng.choice("ACGT") for _ in range(rng.randint(4, 10))])
+        mismatches = rng.randint(0, min(2, len(seed)-1))
+        seq = "".join([rng.choice("ACGT") for _ in range(rng.randint(0, 25))])
+        for _ in range(rng.randint(0, 2)):
+            hit = _mutate(rng, seed, rng.randint(0, 3), indels)
+            i = rng.randint(0, len(seq))
+            seq = seq[:i] + hit + seq[i:]
+        yield seed, seq, mismatches
+
+
+def test_matcher_mismatches_same_as_brute_force():
+    for seed, seq, mm in _matcher_cases(False):
+        expected = brute_mismatch(seed, seq, mm)
+        assert AdapterMatcher(seed, mm).find(seq) == expected, (seed, seq)
+
+
+def test_matcher_indels_same_as_brute_force():
+    for seed, seq, mm in _matcher_cases(True):
+        expected = brute_indel(seed, seq, mm)
+        assert AdapterMatcher(seed, mm, True).find(seq) == expected, (seed, seq)
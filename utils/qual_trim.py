@@ -12,10 +12,11 @@
    Phred  = -10 * log_10(P)
    Solexa = -10 * log_10(P / (1 - P))
 
+   The trimming itself is done by dnapilib.quality.quality_trim.
+
 """
 
 import sys
-import re
 import os.path
 import signal
 import math
@@ -24,22 +25,9 @@ from argparse import ArgumentParser
 
 cur = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(cur))
-from dnapilib.io_utils import get_file_obj, fastq_record
-
-
-def solexa_to_phred(x):
-    return int(round(10 * math.log10(1+10**(x/10.0))))
-
-
-def illumina_64B(x):
-    if x == 2:
-        return 0
-    else:
-        return x
-
-
-def illumina_33(x):
-    return x
+from dnapilib.io_utils import get_file_obj, fastq_lines
+from dnapilib.quality import peek_qual_offset, phred_table, quality_trim
+from dnapilib.quality import solexa_to_phred, illumina_64B, illumina_33
 
 
 def calc_qual_score(p, solexa):
@@ -50,7 +38,21 @@ def calc_qual_score(p, solexa):
         return int(-10 * math.log10(p))
 
 
+def base_value(s):
+    if s == "auto":
+        return s
+    return int(s)
+
+
 def qual_trim(args):
+    blocks = fastq_lines(get_file_obj(args.FASTQ, binary=True))
+    if args.b == "auto":
+        name, args.b, blocks = peek_qual_offset(blocks)
+        if not args.solexa and not args.illumina5:
+            args.solexa = name == "Solexa"
+            args.illumina5 = name == "Illumina-1.5+"
+        sys.stderr.write("quality encoding: {}\n".format(name))
+
     if args.solexa:
         args.b = 64
         func = solexa_to_phred
@@ -73,29 +75,12 @@ def qual_trim(args):
     else:
         cutoff = calc_qual_score(args.p, args.solexa)
 
-    base = args.b
-    minlen = args.l
-    ns = re.compile('N', re.IGNORECASE)
-    fastqs = fastq_record(get_file_obj(args.FASTQ))
-    for read in fastqs:
-        read = read.rstrip().split("\n")
-        qual = read[3]
-        s, max_s = 0, 0
-        max_i = len(read[3])
-        if minlen > max_i:
-            continue
-        for i in reversed(range(max_i)):
-            q = func(ord(qual[i]) - base)
-            s += cutoff - q
-            if s < 0:
-                break
-            if s > max_s:
-                max_s, max_i = s, i
-        read[1] = read[1][:max_i]
-        read[3] = read[3][:max_i]
-        n_num = len(ns.findall(read[1]))
-        if n_num < len(read[1]) and len(read[1]) >= minlen:
-            print("\n".join(read))
+    table = phred_table(args.b, func)
+    out = sys.stdout.buffer
+    for lines in quality_trim(blocks, table, cutoff, args.l):
+        if lines:
+            out.write(("\n".join(lines) + "\n").encode("latin-1"))
+    out.flush()
 
 
 if __name__ == "__main__":
@@ -108,11 +93,12 @@ if __name__ == "__main__":
                  description="Perform quality trimming for single-end reads.")
     parser.add_argument("FASTQ",
         type=str,
-        help="including stdin or compressed file {zip,gz,tar,bz}")
+        help="including stdin or compressed file {zip,gz,tar,bz,xz,zst}")
     parser.add_argument("-b",
         metavar="BASE",
-        type=int, default=33,
-        help="ASCII-encoded quality offset, e.g. 33 or 64 (default: %(default)s)")
+        type=base_value, default=33,
+        help="ASCII-encoded quality offset, e.g. 33 or 64, or 'auto' "
+             "to guess it from the first reads (default: %(default)s)")
     parser.add_argument("-p",
         metavar="PROB",
         type=float, default=0.1,
@@ -2,8 +2,9 @@
 
 """Clip off adapters from reads in FASTQ by searching kmer
    exact prefix matches. There is an option '-s' that tries
-   to find prefix matches in length of (k + 1) nucleotides
-   with 1 mismatch if perfect prefix matches are not found.
+   to find prefix matches in length of (k + n) nucleotides
+   with n mismatches (1 by default, optionally counting indels)
+   if perfect prefix matches are not found.
    After adapter removal, the program tallies clean reads
    and writes non-redundant reads with the counts in FASTA.
 
@@ -11,25 +12,26 @@
 
 
 import sys
-import re
 import os.path
 import signal
-from operator import itemgetter
 from argparse import ArgumentParser
 
 
 cur = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(cur))
 from dnapilib.io_utils import get_file_obj, fastq_sequence
+from dnapilib.trim import AdapterMatcher
+from dnapilib.collapse import ReadCollapser
 
 
-def make_regex(a_seq, a_len, is_3prime, sensitive):
+def make_matcher(a_seq, a_len, is_3prime, sensitive, mismatches=1,
+                 indels=False):
     if not a_seq:
-        return None, None
+        return None
 
     cutoff = a_len
     if sensitive:
-        cutoff = a_len + 1
+        cutoff = a_len + mismatches
 
     if len(a_seq) < cutoff:
         message = "input adapters longer than {} nt"
@@ -37,44 +39,36 @@ def make_regex(a_seq, a_len, is_3prime, sensitive):
 
     a_seq = a_seq.upper().replace('U', 'T')
     if is_3prime:
-        pat = "(.*)"
-        p_seq, m_seq = a_seq[:a_len], a_seq[:a_len+1]
-        beg, end = 0, a_len
+        p_seq, m_seq = a_seq[:a_len], a_seq[:cutoff]
     else:
-        pat = "(.*?)"
-        p_seq, m_seq = a_seq[-a_len:], a_seq[-(a_len+1):]
-        beg, end = 1, a_len+1
+        p_seq, m_seq = a_seq[-a_len:][::-1], a_seq[-cutoff:][::-1]
 
-    pp = re.compile(pat+p_seq, re.IGNORECASE)
     if not sensitive:
-        return pp, []
+        return p_seq, None
+    return p_seq, AdapterMatcher(m_seq, mismatches, indels)
 
-    mp = []
-    seed = list(m_seq)
-    for i in range(beg, end):
-        ps = seed[:]
-        ps[i] = '.'
-        x = re.compile(pat+''.join(ps), re.IGNORECASE)
-        mp.append(x)
-    return pp, mp
 
+def match_adapters(seq, matcher, is_3prime):
+    """Return the cut position of the rightmost 3' (or leftmost 5')
+       adapter hit in a read and the number of edits, or the end
+       of the read and '*' if there is no hit. 5' adapters are
+       searched in the reversed read with the reversed seed.
 
-def match_adapters(seq, pp, mps, sensitive, pi=0, mi=0, l=0):
-    if not pp:
+    """
+    l = len(seq) if is_3prime else 0
+    if not matcher:
         return l, '*'
+    p_seq, mp = matcher
+    seq = seq.upper() if is_3prime else seq.upper()[::-1]
 
-    p = pp.search(seq)
-    if p:
-        return (p.end()-pi), '0'
-
-    if not sensitive:
+    i, mm = seq.rfind(p_seq), 0
+    if i < 0 and mp:
+        i, mm = mp.find(seq)
+    if i < 0:
         return l, '*'
-    else:
-        for mp in mps:
-            m = mp.search(seq)
-            if m:
-                return (m.end()-mi), '1'
-    return l, '*'
+    if is_3prime:
+        return i, str(mm)
+    return len(seq) - i, str(mm)
 
 
 def to_fasta(args):
@@ -96,6 +90,10 @@ def to_fasta(args):
         raise Exception("input positive value for 3'trimming")
     if args.trim_5p < 0:
         raise Exception("input positive value for 5'trimming")
+    if args.mismatches <= 0:
+        raise Exception("bad value: --mismatches")
+    if args.memory is not None and args.memory <= 0:
+        raise Exception("bad value: --memory")
 
     f_seq, f_len = args.f, args.seed_5p
     b_seq, b_len = args.b, args.seed_3p
@@ -109,23 +107,36 @@ def to_fasta(args):
     elif f_seq and not b_seq:
         req = lambda x, y: x != '*' or args.a
 
-    f_pp, f_mp = make_regex(f_seq, f_len, False, args.s)
-    b_pp, b_mp = make_regex(b_seq, b_len, True,  args.s)
-
-    fas = {}
-    for seq in fastq_sequence(get_file_obj(args.FASTQ)):
-        seq_len = len(seq)
-        f_i, f_mm = match_adapters(seq, f_pp, f_mp, args.s)
-        b_i, b_mm = match_adapters(seq, b_pp, b_mp, args.s,
-                                   b_len, b_len+1, seq_len)
+    f_mt = make_matcher(f_seq, f_len, False, args.s,
+                        args.mismatches, args.indels)
+    b_mt = make_matcher(b_seq, b_len, True,  args.s,
+                        args.mismatches, args.indels)
+
+    memory = None
+    if args.memory:
+        memory = args.memory * 1024 * 1024
+    fas = ReadCollapser(memory, args.temp_dir, args.packed)
+    block = {}
+    for seq in fastq_sequence(get_file_obj(args.FASTQ, binary=True)):
+        f_i, f_mm = match_adapters(seq, f_mt, False)
+        b_i, b_mm = match_adapters(seq, b_mt, True)
         ins = seq[f_i+args.trim_5p : b_i-args.trim_3p]
         ins_len = len(ins)
         if req(f_mm, b_mm) and (args.m <= ins_len and ins_len <= args.x):
-            fas[ins] = fas.get(ins, 0) + 1
-
-    fas = sorted(fas.items(), key=itemgetter(0))
-    for seq, cnt in fas:
-        print(">{0}_{1}\n{0}".format(seq, cnt))
+            block[ins] = block.get(ins, 0) + 1
+            if len(block) == 100000:
+                fas.update(block)
+                block = {}
+    fas.update(block)
+
+    out = sys.stdout
+    buf = []
+    for seq, cnt in fas.items(sort=True):
+        buf.append(">{0}_{1}\n{0}\n".format(seq, cnt))
+        if len(buf) == 10000:
+            out.write("".join(buf))
+            buf = []
+    out.write("".join(buf))
 
 
 if __name__ == "__main__":
@@ -138,7 +149,7 @@ if __name__ == "__main__":
         description="Remove adapters and collapse reads from FASTQ to FASTA")
     parser.add_argument("FASTQ",
         type=str,
-        help="including stdin or compressed file {zip,gz,tar,bz}")
+        help="including stdin or compressed file {zip,gz,tar,bz,xz,zst}")
     parser.add_argument("-3",
         metavar="SEQ",
         dest="b",
@@ -173,7 +184,27 @@ if __name__ == "__main__":
         help="maximum read length in bp (default: %(default)s)")
     parser.add_argument("-s",
         action="store_true",
-        help="sensitive adapter search with 1 mismatch (default: off)")
+        help="sensitive adapter search with mismatches (default: off)")
+    parser.add_argument("--mismatches",
+        metavar="INT",
+        type=int, default=1,
+        help="number of mismatches allowed in '-s' mode, matching "
+             "(seed + INT) bp of adapters (default: %(default)s)")
+    parser.add_argument("--indels",
+        action="store_true",
+        help="count insertions and deletions as mismatches in '-s' mode")
+    parser.add_argument("--memory",
+        metavar="MB",
+        type=int, default=None,
+        help="memory for collapsing reads, beyond which sorted reads "
+             "are spilled to temporary files (default: no limit)")
+    parser.add_argument("--temp-dir",
+        metavar="DIRECTORY",
+        default=None,
+        help="directory for the spilled reads (default: system default)")
+    parser.add_argument("--packed",
+        action="store_true",
+        help="keep collapsed reads packed in 2 bits per base in memory")
     parser.add_argument("-B",
         action="store_true",
         help="only print the reads with both 5' and 3' adapter matches")